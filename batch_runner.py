@@ -0,0 +1,202 @@
+"""
+Esecuzione batch di prompt (JSONL) attraverso la stessa pipeline della chat.
+
+Usage:
+    python batch_runner.py prompts.jsonl results.jsonl --model llama3.1 \
+        --hosts http://localhost:11434,http://192.168.1.125:11434 --concurrency 8
+
+Righe: {"prompt" (o "message"), "id", "model", "history", "use_web", "deep_context"}.
+Gli id gia' completati nel file di output vengono saltati (ripresa).
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import numpy as np
+
+from chat_engine import stream_chat
+from context_window import context_manager
+from host_pool import host_pool, DEFAULT_HOSTS
+
+PERCENTILES = (50, 90, 99)
+
+
+def load_prompts(path):
+    prompts = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            item.setdefault("id", str(line_number))
+            item["id"] = str(item["id"])
+            item["prompt"] = item.get("prompt") or item.get("message") or ""
+            prompts.append(item)
+    return prompts
+
+
+def completed_ids(path):
+    """Id gia' completati con successo in un output precedente."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by an interruption
+            if record.get("status") == "ok":
+                done.add(str(record.get("id")))
+    return done
+
+
+def _ends_with_newline(path):
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def percentiles(values, points=PERCENTILES):
+    if not values:
+        return {f"p{p}": None for p in points}
+    result = np.percentile(np.asarray(values, dtype=float), points)
+    return {f"p{p}": round(float(v), 4) for p, v in zip(points, result)}
+
+
+class HostBalancer:
+    """Host con meno prompt in corso (tra quelli passati da riga di comando)."""
+
+    def __init__(self, hosts):
+        self.in_flight = {h: 0 for h in hosts}
+
+    def acquire(self, model):
+        # Runs on the event loop: only the monitor's cached state, never a health check
+        states = {h: host_pool.cached(h) for h in self.in_flight}
+        usable = [h for h, s in states.items() if s is not None and s.healthy and model in s.models]
+        host = min(usable or self.in_flight, key=self.in_flight.get)
+        self.in_flight[host] += 1
+        return host
+
+    def release(self, host):
+        self.in_flight[host] -= 1
+
+
+async def run_one(item, args, balancer):
+    model = item.get("model") or args.model
+    host = balancer.acquire(model)
+    session_id = f"batch-{item['id']}"
+    record = {"id": item["id"], "prompt": item["prompt"], "model": model, "host": host, "status": "ok"}
+    start = time.perf_counter()
+    first_token = None
+    try:
+        async for event in stream_chat(
+            item["prompt"], item.get("history", []), model, host,
+            use_web=item.get("use_web", not args.no_web), session_id=session_id,
+            save_logs=args.save_logs, remember=False,
+            deep_context=item.get("deep_context", args.deep_context),
+        ):
+            kind = event["type"]
+            if kind == "delta" and first_token is None:
+                first_token = time.perf_counter() - start
+            elif kind == "search":
+                record["search_results"] = len(event["results"])
+            elif kind == "done":
+                usage = event["usage"]
+                record.update(answer=event["content"], host=event["host"], cached=event["cached"], **usage)
+                if usage.get("eval_duration"):
+                    record["tokens_per_second"] = usage["completion_tokens"] / (usage["eval_duration"] / 1e9)
+            elif kind == "cancelled":
+                record.update(status="cancelled", answer=event["content"])
+            elif kind == "error":
+                record.update(status="error", error=event["message"])
+    finally:
+        balancer.release(host)
+        context_manager.reset(session_id)
+    record["ttft"] = first_token
+    record["latency"] = time.perf_counter() - start
+    return record
+
+
+async def run_batch(args):
+    prompts = load_prompts(args.input)
+    if not args.model and any(not p.get("model") for p in prompts):
+        raise SystemExit("--model e' obbligatorio per le righe senza \"model\"")
+    skip = completed_ids(args.output)
+    pending = [p for p in prompts if p["id"] not in skip]
+    print(f"{len(prompts)} prompt, {len(prompts) - len(pending)} gia' completati, {len(pending)} da eseguire")
+
+    hosts = [h.strip().rstrip("/") for h in args.hosts.split(",") if h.strip()]
+    for host in hosts:
+        host_pool.add_host(host)
+    # First check off the loop, so the balancer starts with real state
+    await asyncio.to_thread(host_pool.check_all)
+    host_pool.start()
+    balancer = HostBalancer(hosts)
+
+    queue = asyncio.Queue()
+    for item in pending:
+        queue.put_nowait(item)
+    records = []
+    start = time.perf_counter()
+
+    with open(args.output, "a", encoding="utf-8") as out:
+        if out.tell() and not _ends_with_newline(args.output):
+            out.write("\n")  # close the line an interruption cut short
+        async def worker():
+            while not queue.empty():
+                item = queue.get_nowait()
+                record = await run_one(item, args, balancer)
+                # One whole line per prompt, flushed: an interruption loses at most the running ones
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                records.append(record)
+                mark = "✓" if record["status"] == "ok" else "✗"
+                print(f"{mark} [{len(records)}/{len(pending)}] {record['id']} ({record['latency']:.1f}s)")
+
+        await asyncio.gather(*(worker() for _ in range(min(args.concurrency, len(pending)) or 1)))
+
+    return summarize(records, time.perf_counter() - start)
+
+
+def summarize(records, elapsed):
+    ok = [r for r in records if r["status"] == "ok"]
+    completion_tokens = sum(r.get("completion_tokens", 0) for r in ok)
+    return {
+        "prompts": len(records),
+        "ok": len(ok),
+        "errors": sum(r["status"] == "error" for r in records),
+        "cancelled": sum(r["status"] == "cancelled" for r in records),
+        "elapsed_seconds": round(elapsed, 2),
+        "prompts_per_second": round(len(ok) / elapsed, 3) if elapsed else None,
+        "output_tokens_per_second": round(completion_tokens / elapsed, 1) if elapsed else None,
+        "ttft_seconds": percentiles([r["ttft"] for r in ok if r["ttft"] is not None]),
+        "latency_seconds": percentiles([r["latency"] for r in ok]),
+        "decode_tokens_per_second": percentiles([r["tokens_per_second"] for r in ok if r.get("tokens_per_second")]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Esegue un file JSONL di prompt attraverso la pipeline della chat")
+    parser.add_argument("input", help="JSONL di prompt")
+    parser.add_argument("output", help="JSONL dei risultati (append, ripresa automatica)")
+    parser.add_argument("--model", help="modello di default per le righe senza \"model\"")
+    parser.add_argument("--hosts", default=",".join(DEFAULT_HOSTS), help="host Ollama separati da virgola")
+    parser.add_argument("--concurrency", type=int, default=4, help="prompt in corso contemporaneamente")
+    parser.add_argument("--no-web", action="store_true", help="disattiva la ricerca SearXNG")
+    parser.add_argument("--deep-context", action="store_true", help="usa il testo delle pagine, non solo gli snippet")
+    parser.add_argument("--save-logs", action="store_true", help="scrive anche i log giornalieri della chat")
+    parser.add_argument("--summary", help="scrive il riepilogo anche in questo file JSON")
+    args = parser.parse_args()
+
+    summary = asyncio.run(run_batch(args))
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
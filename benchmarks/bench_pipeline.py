@@ -0,0 +1,266 @@
+"""
+Benchmark end-to-end della pipeline contro Ollama e SearXNG finti (benchmarks/fake_servers.py).
+
+Ogni esecuzione e' una riga JSON nel file dei risultati (con commit e configurazione);
+--compare esce con 1 se una mediana e' peggiorata oltre --threshold.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_pipeline [--iterations 20] [--output benchmarks/results.jsonl] [--compare]
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.fake_servers import FakeOllama, FakeSearXNG, app_environment, make_results
+
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(__file__), "results.jsonl")
+MODEL = "fake-model"
+WEB_QUESTION = "Quali sono le ultime notizie di oggi sul meteo a Roma?"
+PLAIN_QUESTION = "Scrivi una poesia sul mare"
+
+
+def summarize(samples_ms):
+    values = np.asarray(samples_ms, dtype=float)
+    return {
+        "n": int(values.size),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "min_ms": round(float(values.min()), 3),
+        "max_ms": round(float(values.max()), 3),
+    }
+
+
+def timed_ms(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def make_history(turns=8):
+    history = []
+    for i in range(turns):
+        history.append({"role": "user", "content": f"Domanda {i} sul tema della conversazione " + "x" * 80})
+        history.append({"role": "assistant", "content": "Risposta dettagliata. " * 40})
+    return history
+
+
+# === BENCHMARK ===
+def bench_search(searxng_json, searxng_html, iterations):
+    import searxng
+    from chat_engine import search_searxng
+    from search_cache import cache as search_cache
+
+    def cold():
+        search_cache.clear()
+        search_searxng("previsioni meteo roma")
+
+    results = {
+        "search_searxng_json": summarize(timed_ms(cold, iterations)),
+        "search_searxng_cached": summarize(timed_ms(lambda: search_searxng("previsioni meteo roma"), iterations)),
+    }
+    # JSON disabled: the first call learns HTML mode, the rest go straight to HTML
+    searxng.fetch_results(searxng_html.search_url, "probe", "it")
+    results["searxng_html_fallback"] = summarize(
+        timed_ms(lambda: searxng.fetch_results(searxng_html.search_url, "previsioni meteo roma", "it"), iterations)
+    )
+    return results
+
+
+def bench_deep_context(searxng_json, iterations):
+    from page_fetch import enrich_results, page_cache
+
+    results = make_results("previsioni meteo roma", base_url=searxng_json.url)
+
+    def cold():
+        page_cache.clear()
+        enrich_results(results)
+
+    timings = {"deep_context_fetch": summarize(timed_ms(cold, iterations))}
+    ttl = page_cache.ttl
+    page_cache.ttl = 0  # every lookup revalidates
+    try:
+        timings["deep_context_revalidate"] = summarize(timed_ms(lambda: enrich_results(results), iterations))
+    finally:
+        page_cache.ttl = ttl
+    return timings
+
+
+def bench_prompt_assembly(iterations):
+    from chat_engine import extract_text_from_content
+    from context_packer import pack_context
+    from context_window import context_manager
+    from prompt_builder import build_messages, user_turn
+
+    history = make_history()
+    results = make_results("previsioni meteo roma")
+
+    def assemble():
+        messages = build_messages(history + [{"role": "user", "content": WEB_QUESTION}], extract_text_from_content)
+        messages = context_manager.fit("bench", MODEL, messages)
+        messages[-1]["content"] = user_turn(WEB_QUESTION, pack_context(WEB_QUESTION, results)[0])
+
+    return {"prompt_assembly": summarize(timed_ms(assemble, iterations * 10))}
+
+
+async def _bot_turn(ollama_url, question, use_web, session_id):
+    """Il loop di `bot`: eventi del motore, StreamBuffer, un update della UI per flush."""
+    from chat_engine import stream_chat
+    from stream_buffer import StreamBuffer
+
+    buffer = StreamBuffer()
+    updates = 0
+    ttft = None
+    start = time.perf_counter()
+    async for event in stream_chat(question, [], MODEL, ollama_url, use_web, session_id=session_id,
+                                   save_logs=False, remember=False):
+        if event["type"] == "delta":
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            if buffer.add(event["content"]):
+                buffer.flush()
+                updates += 1
+        elif event["type"] == "error":
+            raise RuntimeError(event["message"])
+    buffer.flush()
+    return ttft * 1000, (time.perf_counter() - start) * 1000, updates + 1
+
+
+async def _bench_bot(ollama, iterations):
+    from search_cache import cache as search_cache
+
+    results = {}
+    for name, question, use_web in (("bot_stream_web", WEB_QUESTION, True), ("bot_stream", PLAIN_QUESTION, False)):
+        ttfts, totals, updates = [], [], []
+        for i in range(iterations):
+            search_cache.clear()
+            ttft, total, n = await _bot_turn(ollama.url, question, use_web, f"bench-{name}-{i}")
+            ttfts.append(ttft)
+            totals.append(total)
+            updates.append(n)
+        results[name] = summarize(totals)
+        results[name]["ttft"] = summarize(ttfts)
+        results[name]["ui_updates"] = int(np.median(updates))
+    return results
+
+
+def bench_bot(ollama, iterations):
+    from ollama_pool import registry
+
+    # One event loop for every turn, like the Gradio app: one AsyncClient, reused
+    try:
+        return asyncio.run(_bench_bot(ollama, iterations))
+    finally:
+        registry.close_all()
+
+
+def bench_models(ollama, iterations):
+    from host_pool import host_pool
+
+    host_pool.refresh(ollama.url)
+    return {
+        "get_available_models_cached": summarize(timed_ms(lambda: host_pool.models(ollama.url), iterations * 10)),
+        "get_available_models_refresh": summarize(timed_ms(lambda: host_pool.refresh(ollama.url), iterations)),
+    }
+
+
+# === RISULTATI ===
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def previous_run(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        lines = [line for line in f if line.strip()]
+    return json.loads(lines[-1]) if lines else None
+
+
+def regressions(previous, current, threshold, min_delta_ms):
+    found = []
+    for name, stats in current["results"].items():
+        before = previous["results"].get(name)
+        if not before:
+            continue
+        # Sub-millisecond timings jitter by large ratios: require an absolute delta too
+        delta = stats["p50_ms"] - before["p50_ms"]
+        if delta > min_delta_ms and stats["p50_ms"] > before["p50_ms"] * (1 + threshold):
+            found.append((name, before["p50_ms"], stats["p50_ms"]))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="file JSONL, una riga per esecuzione")
+    parser.add_argument("--ttft", type=float, default=0.05, help="TTFT di Ollama finto (s)")
+    parser.add_argument("--tokens-per-second", type=float, default=400.0)
+    parser.add_argument("--chunk-tokens", type=int, default=1)
+    parser.add_argument("--answer-tokens", type=int, default=100)
+    parser.add_argument("--search-latency", type=float, default=0.02, help="latenza di SearXNG finto (s)")
+    parser.add_argument("--compare", action="store_true", help="confronta con l'esecuzione precedente")
+    parser.add_argument("--threshold", type=float, default=0.2, help="rallentamento tollerato (0.2 = +20%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="rallentamento minimo assoluto per segnalare")
+    args = parser.parse_args()
+
+    ollama = FakeOllama(args.ttft, args.tokens_per_second, args.chunk_tokens, args.answer_tokens, models=[MODEL]).start()
+    searxng_json = FakeSearXNG(args.search_latency).start()
+    searxng_html = FakeSearXNG(args.search_latency, json_enabled=False).start()
+
+    # The app modules read their configuration at import time
+    workdir = tempfile.mkdtemp(prefix="ollweb-bench-")
+    os.environ.update(app_environment(ollama, searxng_json, workdir))
+    os.environ.pop("SEARCH_CACHE_DB", None)
+
+    results = {}
+    results.update(bench_search(searxng_json, searxng_html, args.iterations))
+    results.update(bench_deep_context(searxng_json, args.iterations))
+    results.update(bench_prompt_assembly(args.iterations))
+    results.update(bench_bot(ollama, args.iterations))
+    results.update(bench_models(ollama, args.iterations))
+
+    run = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare", "threshold", "min_delta_ms")},
+        "results": results,
+    }
+    for name, stats in results.items():
+        extra = f" | TTFT p50 {stats['ttft']['p50_ms']:.1f} ms" if "ttft" in stats else ""
+        print(f"{name:>32}: p50 {stats['p50_ms']:9.3f} ms | p95 {stats['p95_ms']:9.3f} ms{extra}")
+
+    previous = previous_run(args.output)
+    with open(args.output, "a", encoding="utf-8") as f:
+        f.write(json.dumps(run) + "\n")
+    print(f"Risultati aggiunti a {args.output}")
+
+    if args.compare and previous is not None:
+        if previous.get("config") != run["config"]:
+            print("Attenzione: configurazione diversa dall'esecuzione precedente")
+        slower = regressions(previous, run, args.threshold, args.min_delta_ms)
+        for name, before, after in slower:
+            print(f"REGRESSIONE {name}: p50 {before:.3f} -> {after:.3f} ms")
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Microbenchmark del parsing HTML di SearXNG: BeautifulSoup vs estrattore mirato.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_searxng_html [pagina.html ...]
+
+Without arguments every page saved in benchmarks/data/ is used. The parser is
+first checked against the JSON results of the fake SearXNG (benchmarks/fake_servers.py).
+Needs beautifulsoup4: pip install -r benchmarks/requirements.txt
+"""
+import glob
+import os
+import sys
+import timeit
+
+from bs4 import BeautifulSoup
+
+from benchmarks.fake_servers import make_results, render_html
+from searxng import parse_html_results
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+
+
+def parse_with_bs4(html):
+    """Il vecchio parser di search_searxng, mantenuto come riferimento."""
+    soup = BeautifulSoup(html, "html.parser")
+    results = []
+    for article in soup.select("article.result"):
+        title_elem = article.select_one("h3 a, h4 a")
+        content_elem = article.select_one(".content, .result-content")
+        if title_elem:
+            results.append({
+                "title": title_elem.get_text(strip=True),
+                "url": title_elem.get("href"),
+                "content": content_elem.get_text(strip=True) if content_elem else "",
+            })
+    return results
+
+
+def check_against_json():
+    """L'HTML deve dare gli stessi URL e testi (a meno degli spazi) del formato JSON."""
+    expected = make_results("previsioni meteo roma")
+    # Inline markup as SearXNG writes it: highlighted terms, line breaks, icons
+    html = render_html(expected).replace(
+        "Testo di esempio", '<span class="highlight">Testo</span> di<br/>esempio <img src="x.png" />'
+    )
+    found = parse_html_results(html)
+    normalize = lambda results: [(r["url"], " ".join(r["content"].split())) for r in results]
+    assert normalize(found) == normalize(expected), "HTML and JSON results differ"
+
+
+def bench_page(path, number=200):
+    with open(path, encoding="utf-8") as f:
+        html = f.read()
+
+    baseline = parse_with_bs4(html)
+    fast = parse_html_results(html)
+    # Same results found; text may differ only in whitespace between inline tags
+    assert [r["url"] for r in baseline] == [r["url"] for r in fast], "URL mismatch"
+
+    bs4_s = min(timeit.repeat(lambda: parse_with_bs4(html), number=number, repeat=3)) / number
+    fast_s = min(timeit.repeat(lambda: parse_html_results(html), number=number, repeat=3)) / number
+    return {
+        "page": os.path.basename(path),
+        "bytes": len(html.encode("utf-8")),
+        "results": len(fast),
+        "bs4_ms": bs4_s * 1000,
+        "fast_ms": fast_s * 1000,
+        "speedup": bs4_s / fast_s,
+    }
+
+
+def main(paths):
+    check_against_json()
+    paths = paths or sorted(glob.glob(os.path.join(DATA_DIR, "*.html")))
+    for path in paths:
+        r = bench_page(path)
+        print(f"{r['page']}: {r['bytes']} bytes, {r['results']} risultati | "
+              f"bs4 {r['bs4_ms']:.3f} ms | mirato {r['fast_ms']:.3f} ms | x{r['speedup']:.1f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,101 @@
+"""
+Benchmark dello streaming verso il browser: un update per token vs StreamBuffer.
+
+Per ogni strategia: update della UI, byte serializzati da Gradio e tempo CPU.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_streaming [--tokens 1000] [--tokens-per-second 50]
+"""
+import argparse
+import json
+import time
+
+from stream_buffer import StreamBuffer
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_history(turns=10, chars_per_message=600):
+    history = []
+    for i in range(turns):
+        history.append({"role": "user", "content": f"Domanda {i} " + "x" * 60})
+        history.append({"role": "assistant", "content": "Risposta " + "parola " * (chars_per_message // 7)})
+    history.append({"role": "user", "content": "Ultima domanda?"})
+    return history
+
+
+def make_tokens(count):
+    words = ["Il ", "saluto ", "ciao ", "deriva ", "dal ", "veneziano ", "s'ciavo, ", "cioè ", "schiavo. "]
+    return [words[i % len(words)] for i in range(count)]
+
+
+def run_per_token(history, tokens, clock, token_interval):
+    history = history + [{"role": "assistant", "content": ""}]
+    full_bytes = delta_bytes = updates = 0
+    full_response = ""
+    for token in tokens:
+        clock.now += token_interval
+        full_response += token
+        history[-1]["content"] = full_response
+        full_bytes += len(json.dumps(history))
+        delta_bytes += len(json.dumps(token))
+        updates += 1
+    return updates, full_bytes, delta_bytes
+
+
+def run_buffered(history, tokens, clock, token_interval):
+    history = history + [{"role": "assistant", "content": ""}]
+    buffer = StreamBuffer(clock=clock)
+    full_bytes = delta_bytes = updates = 0
+    sent = 0
+
+    def emit():
+        nonlocal full_bytes, delta_bytes, updates, sent
+        text = buffer.flush()
+        history[-1]["content"] = text
+        full_bytes += len(json.dumps(history))
+        delta_bytes += len(json.dumps(text[sent:]))
+        sent = len(text)
+        updates += 1
+
+    for token in tokens:
+        clock.now += token_interval
+        if buffer.add(token):
+            emit()
+    emit()
+    return updates, full_bytes, delta_bytes
+
+
+def measure(strategy, tokens, tokens_per_second, repeat=5):
+    history = make_history()
+    best_cpu = None
+    for _ in range(repeat):
+        start = time.process_time()
+        result = strategy(history, tokens, FakeClock(), 1.0 / tokens_per_second)
+        cpu = time.process_time() - start
+        best_cpu = cpu if best_cpu is None else min(best_cpu, cpu)
+    updates, full_bytes, delta_bytes = result
+    return {"updates": updates, "full_bytes": full_bytes, "delta_bytes": delta_bytes, "cpu_ms": best_cpu * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=1000)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    args = parser.parse_args()
+
+    tokens = make_tokens(args.tokens)
+    for name, strategy in (("per token", run_per_token), ("StreamBuffer", run_buffered)):
+        r = measure(strategy, tokens, args.tokens_per_second)
+        print(f"{name:>12}: {r['updates']:5d} update | {r['full_bytes'] / 1024:9.1f} KiB storia completa | "
+              f"{r['delta_bytes'] / 1024:6.1f} KiB delta | CPU {r['cpu_ms']:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+"""
+Server finti di Ollama e SearXNG per benchmark e test di carico senza gli host reali.
+
+TTFT, velocita' di decodifica e token per chunk configurabili; SearXNG finto
+serve JSON (o 403), HTML e le pagine dei risultati (/page/<n>, con ETag e 304).
+
+Usage (from the repository root), to point the apps at them by hand:
+    python -m benchmarks.fake_servers [--ollama-port 11500] [--searxng-port 11501] [--ttft 0.2] [--tokens-per-second 40]
+"""
+import argparse
+import hashlib
+import html
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+WORDS = ["Il ", "saluto ", "ciao ", "deriva ", "dal ", "veneziano ", "s'ciavo, ", "cioè ", "schiavo. "]
+EMBED_DIM = 64
+
+
+class _Server:
+    """Server HTTP in un thread daemon; `url` e' valido dopo start()."""
+
+    handler = None
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._httpd = None
+
+    def start(self):
+        server = self
+
+        class Handler(self.handler):
+            owner = server
+
+        self._httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        threading.Thread(target=self._httpd.serve_forever, name=type(self).__name__, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+
+    def count(self):
+        with self._lock:
+            self.requests += 1
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes: without this, Nagle plus
+    # the client's delayed ACK add ~40 ms to every response
+    disable_nagle_algorithm = True
+    owner = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, content_type="application/json"):
+        data = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+
+# === OLLAMA ===
+class _OllamaHandler(_Handler):
+    def do_GET(self):
+        self.owner.count()
+        path = urlparse(self.path).path
+        if path == "/api/tags":
+            self._send(200, {"models": [{"name": m, "model": m, "size": 0} for m in self.owner.models]})
+        elif path == "/api/ps":
+            self._send(200, {"models": [{"name": m, "model": m} for m in self.owner.models[:1]]})
+        elif path == "/api/version":
+            self._send(200, {"version": "0.0.0-fake"})
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        self.owner.count()
+        path = urlparse(self.path).path
+        request = self._read_json()
+        if path == "/api/chat":
+            self._chat(request, request.get("stream", True))
+        elif path == "/api/generate":
+            self._send(200, {"model": request.get("model"), "created_at": _now(), "response": "", "done": True})
+        elif path == "/api/embed":
+            inputs = request.get("input", [])
+            inputs = inputs if isinstance(inputs, list) else [inputs]
+            self._send(200, {"model": request.get("model"), "embeddings": [_embedding(t) for t in inputs]})
+        else:
+            self._send(404, {"error": "not found"})
+
+    def _chat(self, request, stream):
+        owner = self.owner
+        model = request.get("model", "")
+        options = request.get("options") or {}
+        tokens = min(owner.answer_tokens, options.get("num_predict") or owner.answer_tokens)
+        prompt_tokens = max(1, len(json.dumps(request.get("messages", []))) // 4)
+        time.sleep(owner.ttft)
+        start = time.perf_counter()
+
+        def chunk(content, done=False):
+            body = {"model": model, "created_at": _now(), "message": {"role": "assistant", "content": content}, "done": done}
+            if done:
+                body.update(
+                    done_reason="stop",
+                    prompt_eval_count=prompt_tokens,
+                    prompt_eval_duration=int(owner.ttft * 1e9),
+                    eval_count=tokens,
+                    eval_duration=max(1, int((time.perf_counter() - start) * 1e9)),
+                )
+            return body
+
+        pieces = ["".join(WORDS[j % len(WORDS)] for j in range(i, min(i + owner.chunk_tokens, tokens)))
+                  for i in range(0, tokens, owner.chunk_tokens)]
+        if not stream:
+            time.sleep(tokens / owner.tokens_per_second)
+            final = chunk("".join(pieces), done=True)
+            self._send(200, final)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        interval = owner.chunk_tokens / owner.tokens_per_second
+        try:
+            for piece in pieces:
+                self._write_chunk(chunk(piece))
+                time.sleep(interval)
+            self._write_chunk(chunk("", done=True))
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # Client went away (cancelled generation): stop like Ollama does
+            owner.disconnects += 1
+
+    def _write_chunk(self, body):
+        data = (json.dumps(body) + "\n").encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+
+class FakeOllama(_Server):
+    handler = _OllamaHandler
+
+    def __init__(self, ttft=0.2, tokens_per_second=40.0, chunk_tokens=1, answer_tokens=200,
+                 models=("fake-model",), host="127.0.0.1", port=0):
+        super().__init__(host, port)
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.chunk_tokens = max(1, chunk_tokens)
+        self.answer_tokens = answer_tokens
+        self.models = list(models)
+        self.disconnects = 0
+
+
+def _now():
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+
+def _embedding(text):
+    # Deterministic pseudo-embedding: same text, same vector
+    digest = hashlib.sha256(text.encode("utf-8")).digest() * (EMBED_DIM // 32)
+    return [b / 255.0 - 0.5 for b in digest[:EMBED_DIM]]
+
+
+# === SEARXNG ===
+def make_results(query, count=10, content_chars=400, base_url="https://example.org"):
+    results = []
+    for i in range(count):
+        text = f"Risultato {i + 1} per {query}. " + "Testo di esempio della pagina con frasi informative. " * (content_chars // 52)
+        results.append({"title": f"{query} - risultato {i + 1}", "url": f"{base_url}/page/{i + 1}", "content": text})
+    return results
+
+
+def render_page(number, paragraphs=40):
+    body = "".join(
+        f"<p>Paragrafo {j + 1} della pagina {number}: testo completo con dettagli, date e numeri "
+        f"che lo snippet di SearXNG non contiene.</p>"
+        for j in range(paragraphs)
+    )
+    return (f'<!DOCTYPE html><html><head><title>Pagina {number}</title><script>var x = "<p>no</p>";</script>'
+            f'<style>p {{ color: red }}</style></head><body><nav><ul><li>Home</li><li>Notizie</li></ul></nav>'
+            f'<main><article><h1>Pagina {number}</h1>{body}</article></main><footer><p>Copyright</p></footer>'
+            f'</body></html>')
+
+
+def render_html(results):
+    articles = "".join(
+        f'<article class="result result-default">'
+        f'<a href="{html.escape(r["url"])}" class="url_header"><span class="url_wrapper">{html.escape(r["url"])}</span></a>'
+        f'<h3><a href="{html.escape(r["url"])}" rel="noreferrer">{html.escape(r["title"])}</a></h3>'
+        f'<p class="content">{html.escape(r["content"])}</p></article>'
+        for r in results
+    )
+    return f'<!DOCTYPE html><html><head><title>SearXNG</title></head><body><div id="urls">{articles}</div></body></html>'
+
+
+class _SearxngHandler(_Handler):
+    def do_GET(self):
+        self.owner.count()
+        parsed = urlparse(self.path)
+        if parsed.path.startswith("/page/"):
+            self._page(parsed.path.rsplit("/", 1)[-1])
+            return
+        if parsed.path != "/search":
+            self._send(404, b"not found", "text/plain")
+            return
+        params = parse_qs(parsed.query)
+        query = params.get("q", [""])[0]
+        time.sleep(self.owner.latency)
+        results = make_results(query, self.owner.result_count, self.owner.content_chars, self.owner.url)
+        if params.get("format", [""])[0] == "json":
+            if not self.owner.json_enabled:
+                self._send(403, b"Forbidden", "text/plain")
+                return
+            self._send(200, {"query": query, "results": results})
+        else:
+            self._send(200, render_html(results).encode("utf-8"), "text/html; charset=utf-8")
+
+
+    def _page(self, number):
+        time.sleep(self.owner.page_latency)
+        etag = f'"page-{number}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.owner.not_modified += 1
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        data = render_page(number).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", "Mon, 01 Dec 2025 10:00:00 GMT")
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client stopped reading (enough text, or past its deadline)
+
+
+class FakeSearXNG(_Server):
+    handler = _SearxngHandler
+
+    def __init__(self, latency=0.05, json_enabled=True, result_count=10, content_chars=400, page_latency=0.05,
+                 host="127.0.0.1", port=0):
+        super().__init__(host, port)
+        self.latency = latency
+        self.page_latency = page_latency
+        self.not_modified = 0
+        self.json_enabled = json_enabled
+        self.result_count = result_count
+        self.content_chars = content_chars
+
+    @property
+    def search_url(self):
+        return f"{self.url}/search"
+
+
+def app_environment(ollama, searxng, workdir):
+    """
+    Variabili d'ambiente che puntano le app ai server finti. The app modules
+    read them at import time, so set them before importing chat_engine & co.
+    Logs go to `workdir`; memory and the response cache are off so every
+    turn reaches the fake Ollama.
+    """
+    return {
+        "OLLAMA_HOSTS": ollama.url,
+        "CHAT_SERVER_OLLAMA_HOST": ollama.url,
+        "SEARXNG_URL": searxng.search_url,
+        "CHAT_LOG_DIR": workdir,
+        "MEMORY_ENABLED": "0",
+        "MEMORY_DIR": os.path.join(workdir, "memory"),
+        "RESPONSE_CACHE": "0",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ollama-port", type=int, default=11500)
+    parser.add_argument("--searxng-port", type=int, default=11501)
+    parser.add_argument("--ttft", type=float, default=0.2)
+    parser.add_argument("--tokens-per-second", type=float, default=40.0)
+    parser.add_argument("--chunk-tokens", type=int, default=1)
+    parser.add_argument("--answer-tokens", type=int, default=200)
+    parser.add_argument("--search-latency", type=float, default=0.05)
+    parser.add_argument("--no-json", action="store_true", help="SearXNG risponde 403 al formato JSON")
+    args = parser.parse_args()
+
+    ollama = FakeOllama(args.ttft, args.tokens_per_second, args.chunk_tokens, args.answer_tokens, port=args.ollama_port).start()
+    searxng = FakeSearXNG(args.search_latency, not args.no_json, port=args.searxng_port).start()
+    print(f"Ollama finto:  {ollama.url}")
+    print(f"SearXNG finto: {searxng.search_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
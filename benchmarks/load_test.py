@@ -0,0 +1,353 @@
+"""
+Test di carico: ripete i log della chat (chat_log_*.md) come utenti simultanei.
+
+Per ogni livello di concorrenza: p50/p95/p99 di TTFT, latenza e attesa in coda,
+throughput ed errori, e il primo livello oltre --max-error-rate o --slo-p95.
+--stack avvia Ollama e SearXNG finti e l'app in questo processo.
+
+Usage (from the repository root):
+    python -m benchmarks.load_test --stack --concurrency 1,4,16,32
+    python -m benchmarks.load_test --url http://127.0.0.1:7860 --model llama3.1 --host http://localhost:11434
+    python -m benchmarks.load_test --target server --url http://127.0.0.1:8000 --model llama3.1
+"""
+import argparse
+import ast
+import datetime
+import glob
+import gzip
+import itertools
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+from benchmarks.fake_servers import FakeOllama, FakeSearXNG, app_environment
+
+PERCENTILES = (50, 95, 99)
+POLL_INTERVAL = 0.005  # seconds between gradio_client status checks
+ERROR_PREFIX = "⚠️"
+SEARCHING_PREFIX = "🔎"
+GRADIO_DEFAULT_HOST = "http://192.168.1.125:11434"  # the Ollama Host dropdown's default
+
+
+# === SESSIONI DAI LOG ===
+def prompt_text(content):
+    """Testo del prompt; old logs hold the repr of Gradio's content list."""
+    if content.startswith("[{"):
+        try:
+            parts = ast.literal_eval(content)
+            return " ".join(p.get("text", "") for p in parts if isinstance(p, dict)).strip()
+        except (ValueError, SyntaxError):
+            pass
+    return content.strip()
+
+
+def load_sessions(paths, session_gap):
+    from log_index import parse_entries
+
+    sessions = []
+    current, last = None, None
+    for path in sorted(paths):
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            entries, _ = parse_entries(f.read())
+        for role, timestamp, content in entries:
+            moment = datetime.datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S")
+            gap = (moment - last).total_seconds() if last else None
+            if current is None or gap is None or gap > session_gap:
+                current = []
+                sessions.append(current)
+                gap = 0.0
+            last = moment
+            if role == "Utente":
+                prompt = prompt_text(content)
+                if prompt:
+                    current.append({"prompt": prompt, "think": gap, "use_web": False})
+            elif role == "SearXNG Search" and current:
+                current[-1]["use_web"] = True
+    return [s for s in sessions if s]
+
+
+def user_script(sessions, index, turns):
+    """I turni dell'utente `index`: sessions in order, starting from a different one per user."""
+    ordered = sessions[index % len(sessions):] + sessions[:index % len(sessions)]
+    return list(itertools.islice(itertools.chain.from_iterable(itertools.cycle(ordered)), turns))
+
+
+# === UTENTI SIMULATI ===
+def _text(content):
+    if isinstance(content, list):
+        return "".join(p.get("text", "") if isinstance(p, dict) else str(p) for p in content)
+    return content if isinstance(content, str) else ""
+
+
+def _message(role, text):
+    # The Chatbot API takes message content as a list of parts
+    return {"role": role, "content": [{"type": "text", "text": text}]}
+
+
+def _answer(output):
+    """Risposta in un output di `/bot` (None finche' c'e' solo il messaggio di ricerca)."""
+    if not output or output[-1].get("role") != "assistant":
+        return None
+    text = _text(output[-1].get("content"))
+    if not text or text.startswith(SEARCHING_PREFIX):
+        return None
+    return text
+
+
+class GradioUser:
+    def __init__(self, url, args):
+        from gradio_client import Client
+
+        self.client = Client(url, verbose=False)
+        self.args = args
+        self.host = args.host or GRADIO_DEFAULT_HOST
+        self.history = []
+        # What the page's load event does: the session's model dropdown gets the host's
+        # models, otherwise /bot rejects the model as not among the choices
+        self.client.predict(self.host, api_name="/update_models")
+
+    def turn(self, prompt, use_web):
+        from gradio_client.utils import Status
+
+        history = self.history + [_message("user", prompt)]
+        record = {"queue_wait": None, "ttft": None, "error": None}
+        start = time.perf_counter()
+        job = self.client.submit(history, self.args.model, use_web, self.host, False, False, self.args.deep_context,
+                                 api_name="/bot")
+        seen = 0
+        while True:
+            done = job.done()
+            now = time.perf_counter() - start
+            if record["queue_wait"] is None and job.status().code in (
+                Status.PROCESSING, Status.ITERATING, Status.FINISHED
+            ):
+                record["queue_wait"] = now
+            outputs = job.outputs()
+            if record["ttft"] is None and any(_answer(o) for o in outputs[seen:]):
+                record["ttft"] = now
+            seen = len(outputs)
+            if done:
+                break
+            time.sleep(POLL_INTERVAL)
+        try:
+            answer = _answer(job.result()) or ""
+        except Exception as e:
+            answer = ""
+            record["error"] = str(e) or type(e).__name__
+        if answer.startswith(ERROR_PREFIX):
+            record["error"] = answer
+        record["latency"] = time.perf_counter() - start
+        self.history = history + [_message("assistant", answer)]
+        return record
+
+
+class ServerUser:
+    def __init__(self, url, args):
+        self.url = url.rstrip("/") + "/chat"
+        self.args = args
+        self.http = requests.Session()
+        self.session_id = f"load-{uuid.uuid4().hex}"
+        self.history = []
+
+    def turn(self, prompt, use_web):
+        record = {"queue_wait": None, "ttft": None, "error": None}
+        body = {"message": prompt, "history": self.history, "model": self.args.model, "use_web": use_web,
+                "deep_context": self.args.deep_context, "session_id": self.session_id}
+        if self.args.host:
+            body["host"] = self.args.host
+        answer = ""
+        start = time.perf_counter()
+        try:
+            with self.http.post(self.url, json=body, stream=True, timeout=(5, 600)) as response:
+                response.raise_for_status()
+                event = None
+                for line in response.iter_lines(decode_unicode=True):
+                    if line.startswith("event: "):
+                        event = line[7:]
+                    elif line.startswith("data: "):
+                        data = json.loads(line[6:])
+                        if event == "delta" and record["ttft"] is None:
+                            record["ttft"] = time.perf_counter() - start
+                        elif event in ("done", "cancelled"):
+                            answer = data["content"]
+                        elif event == "error":
+                            record["error"] = data["message"]
+        except (requests.RequestException, ValueError) as e:
+            record["error"] = str(e)
+        record["latency"] = time.perf_counter() - start
+        self.history = self.history + [{"role": "user", "content": prompt}, {"role": "assistant", "content": answer}]
+        return record
+
+
+# === CARICO ===
+def percentiles(values, points=PERCENTILES):
+    if not values:
+        return {f"p{p}": None for p in points}
+    result = np.percentile(np.asarray(values, dtype=float), points)
+    return {f"p{p}": round(float(v), 4) for p, v in zip(points, result)}
+
+
+def run_level(sessions, concurrency, args):
+    user_class = GradioUser if args.target == "gradio" else ServerUser
+    records = []
+    lock = threading.Lock()
+
+    def simulate(index):
+        if args.ramp:
+            time.sleep(args.ramp * index / concurrency)
+        try:
+            user = user_class(args.url, args)
+        except Exception as e:
+            with lock:
+                records.append({"queue_wait": None, "ttft": None, "latency": None, "error": f"connessione: {e}"})
+            return
+        for turn in user_script(sessions, index, args.turns_per_user):
+            time.sleep(min(turn["think"] * args.think_scale, args.max_think))
+            use_web = turn["use_web"] if args.web == "log" else args.web == "on"
+            record = user.turn(turn["prompt"], use_web)
+            with lock:
+                records.append(record)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(simulate, range(concurrency)))
+    return summarize(concurrency, records, time.perf_counter() - start)
+
+
+def summarize(concurrency, records, elapsed):
+    ok = [r for r in records if not r["error"]]
+    errors = [r["error"] for r in records if r["error"]]
+    return {
+        "concurrency": concurrency,
+        "turns": len(records),
+        "errors": len(errors),
+        "error_rate": round(len(errors) / len(records), 4) if records else None,
+        "turns_per_second": round(len(ok) / elapsed, 3) if elapsed else None,
+        "ttft_seconds": percentiles([r["ttft"] for r in ok if r["ttft"] is not None]),
+        "latency_seconds": percentiles([r["latency"] for r in ok]),
+        "queue_wait_seconds": percentiles([r["queue_wait"] for r in records if r["queue_wait"] is not None]),
+        "sample_errors": sorted(set(errors))[:5],
+    }
+
+
+def scaling_limit(levels, max_error_rate, slo_p95):
+    """Primo livello di concorrenza che viola il tasso di errori o lo SLO sulla latenza p95."""
+    for level in levels:
+        p95 = level["latency_seconds"]["p95"]
+        if (level["error_rate"] or 0) > max_error_rate or (slo_p95 and (p95 is None or p95 > slo_p95)):
+            return level["concurrency"]
+    return None
+
+
+def format_table(levels):
+    def cell(stats):
+        values = [stats[f"p{p}"] for p in PERCENTILES]
+        return "/".join("-" if v is None else f"{v:.2f}" for v in values)
+
+    header = f"{'utenti':>6} {'turni':>6} {'err%':>6} {'turni/s':>8}  {'TTFT p50/95/99':>18}  " \
+             f"{'latenza p50/95/99':>20}  {'coda p50/95/99':>18}"
+    lines = [header]
+    for level in levels:
+        lines.append(
+            f"{level['concurrency']:>6} {level['turns']:>6} {(level['error_rate'] or 0) * 100:>6.1f} "
+            f"{level['turns_per_second'] or 0:>8.2f}  {cell(level['ttft_seconds']):>18}  "
+            f"{cell(level['latency_seconds']):>20}  {cell(level['queue_wait_seconds']):>18}"
+        )
+    return "\n".join(lines)
+
+
+# === STACK LOCALE ===
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_stack(args):
+    """Ollama e SearXNG finti piu' l'app scelta in questo processo; restituisce l'URL dell'app."""
+    ollama = FakeOllama(args.ttft, args.tokens_per_second, args.chunk_tokens, args.answer_tokens,
+                        models=[args.model]).start()
+    searxng = FakeSearXNG(args.search_latency).start()
+    os.environ.update(app_environment(ollama, searxng, tempfile.mkdtemp(prefix="ollweb-load-")))
+    args.host = ollama.url
+    port = _free_port()
+    if args.target == "gradio":
+        import ollweb_gradio
+
+        ollweb_gradio.demo.launch(server_name="127.0.0.1", server_port=port, prevent_thread_lock=True, quiet=True)
+    else:
+        import uvicorn
+        import chat_server
+
+        server = uvicorn.Server(uvicorn.Config(chat_server.app, host="127.0.0.1", port=port, log_level="warning"))
+        threading.Thread(target=server.run, name="chat-server", daemon=True).start()
+        while not server.started:
+            time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logs", default="chat_log_*.md*", help="glob dei log da ripetere")
+    parser.add_argument("--target", choices=("gradio", "server"), default="gradio")
+    parser.add_argument("--url", help="URL dell'app (Gradio o chat_server.py)")
+    parser.add_argument("--stack", action="store_true", help="avvia server finti e app in questo processo")
+    parser.add_argument("--model", help="modello (default con --stack: fake-model)")
+    parser.add_argument("--host", help="host Ollama passato all'app (Gradio: default quello della UI)")
+    parser.add_argument("--concurrency", default="1,2,4,8,16", help="livelli di utenti simultanei")
+    parser.add_argument("--turns-per-user", type=int, default=5)
+    parser.add_argument("--think-scale", type=float, default=0.0, help="fattore sui tempi di riflessione dei log")
+    parser.add_argument("--max-think", type=float, default=30.0, help="tempo di riflessione massimo (s)")
+    parser.add_argument("--ramp", type=float, default=0.0, help="secondi per far entrare tutti gli utenti")
+    parser.add_argument("--web", choices=("log", "on", "off"), default="log",
+                        help="ricerca web: come nei log, sempre o mai")
+    parser.add_argument("--deep-context", action="store_true", help="contesto approfondito (pagine complete)")
+    parser.add_argument("--session-gap", type=float, default=600, help="pausa (s) che separa le sessioni nei log")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--slo-p95", type=float, help="latenza p95 massima accettabile (s)")
+    parser.add_argument("--output", help="scrive il report JSON in questo file")
+    parser.add_argument("--ttft", type=float, default=0.2, help="--stack: TTFT di Ollama finto (s)")
+    parser.add_argument("--tokens-per-second", type=float, default=40.0)
+    parser.add_argument("--chunk-tokens", type=int, default=1)
+    parser.add_argument("--answer-tokens", type=int, default=100)
+    parser.add_argument("--search-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    if args.stack:
+        args.model = args.model or "fake-model"
+        args.url = start_stack(args)
+    elif not args.url or not args.model:
+        parser.error("--url e --model sono obbligatori senza --stack")
+
+    sessions = load_sessions(glob.glob(args.logs), args.session_gap)
+    if not sessions:
+        raise SystemExit(f"Nessun turno utente nei log {args.logs}")
+    print(f"{len(sessions)} sessioni, {sum(len(s) for s in sessions)} turni da {args.logs} -> {args.url}")
+
+    levels = []
+    for concurrency in (int(c) for c in args.concurrency.split(",") if c.strip()):
+        levels.append(run_level(sessions, concurrency, args))
+        print(format_table(levels[-1:]).splitlines()[-1] if len(levels) > 1 else format_table(levels))
+
+    limit = scaling_limit(levels, args.max_error_rate, args.slo_p95)
+    print("\n" + format_table(levels))
+    print(f"Limite: {limit} utenti" if limit else "Nessun livello oltre le soglie")
+    if args.output:
+        report = {"target": args.target, "url": args.url, "model": args.model, "logs": args.logs,
+                  "turns_per_user": args.turns_per_user, "think_scale": args.think_scale,
+                  "levels": levels, "limit": limit}
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
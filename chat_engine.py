@@ -0,0 +1,313 @@
+"""
+Motore di chat headless: gate -> ricerca SearXNG -> prompt -> streaming Ollama.
+
+`stream_chat` is an async generator of event dicts, shared by the Gradio
+app, the Streamlit app (through `iter_chat`) and chat_server.py:
+
+    {"type": "searching", "query": ...}            web search started
+    {"type": "search", "query": ..., "results": [...]}
+    {"type": "delta", "content": ...}              one streamed chunk
+    {"type": "done", "content": ..., "usage": {...}, "timings": {...}, "host": ..., "cached": bool}
+    {"type": "cancelled", "reason": ..., "content": partial answer}
+    {"type": "error", "message": ...}
+"""
+import asyncio
+import os
+import re
+import threading
+import time
+
+from chat_logger import log_message  # queued, written by a background thread
+from ollama_pool import get_client, get_async_client, host_slot
+from search_cache import cache as search_cache
+import searxng
+from search_gate import gate as search_gate, timed_decide
+from context_window import context_manager
+from prompt_builder import build_messages, user_turn, prompt_stats
+from memory_store import memory
+from response_cache import response_cache, replay_stream_async, RESPONSE_CACHE_ENABLED
+from host_pool import host_pool
+from model_warmup import warm_up, keep_alive_for
+from generation_control import generations, GenerationCancelled
+from single_flight import single_flight, payload_key
+from page_fetch import enrich_results, DEEP_CONTEXT
+from context_packer import pack_context, WEB_CONTEXT_TOKENS, DEEP_CONTEXT_TOKENS
+from metrics import timed, observe_generation, turn_seconds
+
+# === CONFIGURAZIONE ===
+API_KEY = os.getenv("OLLAMA_API_KEY")
+SEARXNG_URL = os.getenv("SEARXNG_URL", "http://192.168.1.125:8989/search")
+SEARXNG_LANGUAGE = os.getenv("SEARXNG_LANGUAGE", "it")
+
+
+# === FUNZIONI UTILI ===
+def extract_text_from_content(content):
+    """
+    Extracts text from Gradio's multimodal content format.
+    Handles:
+    - Simple string
+    - List of dicts (Gradio 5.x/6.x multimodal)
+    """
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return " ".join([item["text"] for item in content if isinstance(item, dict) and item.get("type") == "text"])
+    return str(content)
+
+
+def search_searxng(query):
+    """
+    Esegue una ricerca su SearXNG, servendo dalla cache le query ripetute.
+    Richieste identiche concorrenti condividono un'unica chiamata HTTP.
+    """
+    return search_cache.get_or_fetch(query, SEARXNG_LANGUAGE, _fetch_searxng)
+
+
+def _fetch_searxng(query):
+    return searxng.fetch_results(SEARXNG_URL, query, SEARXNG_LANGUAGE, on_error=print)
+
+
+def search_query_for(message, history):
+    """Per domande brevi di seguito, aggiunge l'anno citato nell'ultima domanda dell'utente."""
+    if len(message.strip()) >= 50:
+        return message
+    last_user_msg = next((extract_text_from_content(m["content"]) for m in reversed(history) if m["role"] == "user"), None)
+    if last_user_msg:
+        years = re.findall(r'\b(20\d{2})\b', last_user_msg)
+        if years and years[0] not in message:
+            return f"{message} {years[0]}"
+    return message
+
+
+# The event loop keeps only weak references to tasks: hold fire-and-forget ones here
+_background_tasks = set()
+
+
+def run_in_background(func, *args):
+    """Esegue `func(*args)` in un thread senza attenderla."""
+    task = asyncio.create_task(asyncio.to_thread(func, *args))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+def chunk_content(chunk):
+    if hasattr(chunk, "message") and hasattr(chunk.message, "content"):
+        return chunk.message.content
+    if isinstance(chunk, dict) and "message" in chunk and "content" in chunk["message"]:
+        return chunk["message"]["content"]
+    return None
+
+
+# === PIPELINE ===
+async def stream_chat(message, history, model, host, use_web=True, use_pool=False,
+                      session_id="default", save_logs=True, remember=True, deep_context=DEEP_CONTEXT, owner=None):
+    """
+    Un turno di chat. `history`: i turni precedenti, senza `message`.
+    La memoria a lungo termine si usa solo con un `owner`; `remember=False` la esclude.
+    """
+    def log(role, content):
+        if save_logs:
+            log_message(role, content, session_id)
+
+    turn_start = time.perf_counter()
+    timings = {}  # seconds per stage, also exported as histograms by metrics.py
+    log("Utente", message)
+    generation = generations.begin(session_id, model)
+    content = ""
+    try:
+        # Pool mode: route to the least-loaded healthy host that has the model;
+        # the other candidates are fallbacks until the first token arrives
+        pool_hosts = host_pool.candidates(model) if use_pool else []
+        if pool_hosts:
+            host = pool_hosts[0]
+        stream_hosts = [host] + pool_hosts[1:]
+        client = get_async_client(host, API_KEY)
+        sync_client = get_client(host, API_KEY)
+
+        # Contents are reduced to plain strings (Gradio multimodal lists make the
+        # Ollama client fail); the system prompt is stable for the whole day.
+        with timed("prompt", timings):
+            messages_payload = build_messages(history + [{"role": "user", "content": message}], extract_text_from_content)
+            # Keep the prompt within the model's token budget (older turns -> rolling summary)
+            messages_payload = context_manager.fit(session_id, model, messages_payload, client, host)
+        # Relevant turns from past conversations (long-term memory): the embedding
+        # round-trip runs alongside the gate and the search
+        memory_task = None
+        if memory.enabled_for(owner):
+            memory_task = asyncio.create_task(
+                asyncio.to_thread(memory.inject, sync_client, messages_payload, message, owner, session_id)
+            )
+
+        # Decide locally whether this message needs web context at all
+        if use_web:
+            with timed("gate", timings):
+                use_web, gate_reason, gate_seconds = await asyncio.to_thread(timed_decide, message, sync_client)
+            log("SearXNG Gate", search_gate.describe(use_web, gate_reason, gate_seconds))
+
+        # Answer cache: a hit skips the search and the generation altogether
+        cached_answer = None
+        cache_history = [m for m in messages_payload[1:-1] if m["role"] != "system"]
+        embed = lambda text: memory.embed(sync_client, [text])[0]
+        if RESPONSE_CACHE_ENABLED:
+            cached_answer = await asyncio.to_thread(
+                response_cache.lookup, model, messages_payload[0]["content"], cache_history, message, use_web, embed
+            )
+
+        final_prompt = message
+        if use_web and cached_answer is None:
+            search_query = search_query_for(message, history)
+            # Load the model and prefill system + history while SearXNG answers
+            warmup_task = asyncio.create_task(warm_up(client, host, model, messages_payload[:-1]))
+            _background_tasks.add(warmup_task)
+            warmup_task.add_done_callback(_background_tasks.discard)
+            yield {"type": "searching", "query": search_query}
+            results = []
+            try:
+                # requests is blocking: run the search off the event loop
+                with timed("search", timings):
+                    results = await asyncio.to_thread(search_searxng, search_query) or []
+                search_gate.record_search_latency(timings["search"])
+            except Exception as e:
+                print(f"Web search error: {e}")
+            sources = []
+            if results:
+                context_results = results
+                token_budget = WEB_CONTEXT_TOKENS
+                if deep_context:
+                    # Runs alongside the warm-up; pages that miss the budget keep their snippet
+                    with timed("deep_fetch", timings):
+                        context_results = await asyncio.to_thread(enrich_results, results)
+                    fetched = sum("snippet" in r for r in context_results)
+                    log("SearXNG Pagine", f"{fetched} pagine in {timings['deep_fetch']:.2f}s")
+                    token_budget = DEEP_CONTEXT_TOKENS
+                # The most relevant sentences of all results, within the token budget
+                with timed("prompt", timings):
+                    context, sources = pack_context(search_query, context_results, token_budget)
+                    final_prompt = user_turn(message, context)
+                log("SearXNG Search", "\n".join(
+                    f"{r.get('title', 'No Title')} - {r.get('url', 'No URL')}" for r in sources
+                ))
+            yield {"type": "search", "query": search_query, "results": sources}
+            # The warm-up is not awaited: if it is still loading, Ollama serves the
+            # turn once the model is ready, and a search-cache hit is not held back
+
+        if memory_task is not None and cached_answer is None:
+            with timed("memory", timings):
+                messages_payload = await memory_task
+        # Replace the last message content with our finalized prompt (with context if any)
+        messages_payload[-1]["content"] = final_prompt
+
+        usage = {}
+        ttft = None
+        for attempt, stream_host in enumerate(stream_hosts):
+            try:
+                # The stream is read by a task the generation can cancel (closing the HTTP stream).
+                # Cached answers are replayed through the same loop without touching Ollama.
+                if cached_answer is not None:
+                    stream = generation.stream(lambda: replay_stream_async(cached_answer))
+                else:
+                    # Identical requests already in flight (any session) share one Ollama stream
+                    open_chat = lambda: get_async_client(stream_host, API_KEY).chat(
+                        model=model, messages=messages_payload, stream=True, keep_alive=keep_alive_for(model)
+                    )
+                    key = payload_key(model, messages_payload, host=stream_host.rstrip("/"),
+                                      keep_alive=keep_alive_for(model))
+                    stream = generation.stream(
+                        lambda: single_flight.stream(key, open_chat, slot=host_slot(stream_host),
+                                                     on_close=generation.closed_upstream)
+                    )
+
+                stream_start = time.perf_counter()
+                async for chunk in stream:
+                    delta = chunk_content(chunk)
+                    if delta:
+                        if ttft is None:
+                            # Includes the wait for a free slot on the host
+                            ttft = time.perf_counter() - stream_start
+                        content += delta
+                        yield {"type": "delta", "content": delta}
+                    if getattr(chunk, "done", False):
+                        prompt_stats.record(model, chunk.prompt_eval_count, chunk.prompt_eval_duration)
+                        generation.mark_done(chunk.eval_count, chunk.eval_duration)
+                        observe_generation(model, timings, ttft, chunk.prompt_eval_count, chunk.prompt_eval_duration,
+                                           chunk.eval_count, chunk.eval_duration)
+                        usage = {
+                            "prompt_tokens": chunk.prompt_eval_count or 0,
+                            "completion_tokens": chunk.eval_count or 0,
+                            "prompt_eval_duration": chunk.prompt_eval_duration or 0,
+                            "eval_duration": chunk.eval_duration or 0,
+                        }
+                host = stream_host
+                break
+            except GenerationCancelled:
+                raise
+            except Exception as e:
+                # Fail over only before the first token and while another host is left
+                if content or cached_answer is not None or attempt == len(stream_hosts) - 1:
+                    raise
+                print(f"Ollama host {stream_host} failed before the first token, failing over: {e}")
+                host_pool.mark_failed(stream_host)
+
+        if cached_answer is not None:
+            generation.mark_done()
+        log("Assistente", content)
+        if ttft is not None:
+            timings.setdefault("ttft", ttft)
+        timings["total"] = time.perf_counter() - turn_start
+        turn_seconds.observe(timings["total"], model=model)
+        yield {"type": "done", "content": content, "usage": usage, "timings": timings,
+               "host": host, "cached": cached_answer is not None}
+
+        # A wanted search that brought no context (SearXNG down, no results) is not worth keeping
+        if RESPONSE_CACHE_ENABLED and cached_answer is None and (not use_web or final_prompt != message):
+            run_in_background(
+                response_cache.store, model, messages_payload[0]["content"], cache_history, message,
+                content, use_web, embed
+            )
+        # Embed and store the turn without delaying the answer
+        if remember and memory.enabled_for(owner):
+            run_in_background(memory.add_turn, sync_client, message, content, owner, session_id)
+
+    except GenerationCancelled as e:
+        yield {"type": "cancelled", "reason": e.reason, "content": content}
+    except (GeneratorExit, asyncio.CancelledError):
+        # The consumer went away (closed SSE connection, abandoned UI handler)
+        generation.cancel("disconnessione")
+        raise
+    except Exception as e:
+        yield {"type": "error", "message": str(e)}
+    finally:
+        generations.finish(generation)
+
+
+# === ADATTATORE SINCRONO (Streamlit) ===
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _engine_loop():
+    """Event loop in un thread daemon, condiviso dai chiamanti sincroni."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="chat-engine-loop", daemon=True).start()
+    return _loop
+
+
+def iter_chat(*args, **kwargs):
+    """
+    Come `stream_chat`, come generatore sincrono. Closing it (e.g. a
+    Streamlit rerun interrupting the loop) cancels the generation.
+    """
+    loop = _engine_loop()
+    agen = stream_chat(*args, **kwargs)
+    try:
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(agen.__anext__(), loop).result()
+            except StopAsyncIteration:
+                return
+    finally:
+        asyncio.run_coroutine_threadsafe(agen.aclose(), loop).result()
@@ -0,0 +1,158 @@
+import atexit
+import datetime
+import gzip
+import json
+import os
+import queue
+import shutil
+import threading
+
+from metrics import timed
+
+# === CONFIGURAZIONE ===
+LOG_DIR = os.getenv("CHAT_LOG_DIR", ".")
+# Also write one JSON object per entry to chat_log_YYYY-MM-DD.jsonl
+LOG_JSONL = os.getenv("CHAT_LOG_JSONL", "0") == "1"
+# Size after which the day's file is rotated to chat_log_YYYY-MM-DD.N.md (0 = never)
+LOG_MAX_BYTES = int(os.getenv("CHAT_LOG_MAX_BYTES", str(20 * 1024 * 1024)))
+# Gzip files once they are rotated (by size or because the day changed)
+LOG_COMPRESS = os.getenv("CHAT_LOG_COMPRESS", "1") == "1"
+FLUSH_INTERVAL = 1.0  # seconds
+MAX_BATCH = 256
+
+
+def get_log_file(day=None, extension="md"):
+    day = day or datetime.date.today()
+    return os.path.join(LOG_DIR, f"chat_log_{day.strftime('%Y-%m-%d')}.{extension}")
+
+
+def format_markdown(role, content, timestamp):
+    return f"### {role} ({timestamp})\n{content}\n\n"
+
+
+class ChatLogWriter:
+    """
+    Scrive i log della chat da un unico thread in background.
+    `log` accoda soltanto; rotazione per dimensione e gzip dei file ruotati.
+    """
+
+    def __init__(self, jsonl=LOG_JSONL, max_bytes=LOG_MAX_BYTES, compress=LOG_COMPRESS):
+        self.jsonl = jsonl
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self._queue = queue.Queue()
+        self._current_day = None
+        self._thread = threading.Thread(target=self._run, name="chat-log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log(self, role, content, session_id=None):
+        now = datetime.datetime.now()
+        self._queue.put((now, role, content, session_id))
+
+    def flush(self, timeout=5.0):
+        """Attende che le voci gia' accodate siano su disco."""
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=5.0)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            try:
+                # Collect whatever else arrives within the flush interval
+                deadline = datetime.datetime.now() + datetime.timedelta(seconds=FLUSH_INTERVAL)
+                while len(batch) < MAX_BATCH:
+                    remaining = (deadline - datetime.datetime.now()).total_seconds()
+                    if remaining <= 0 or batch[-1] is None or isinstance(batch[-1], threading.Event):
+                        break
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                pass
+
+            entries = [item for item in batch if isinstance(item, tuple)]
+            try:
+                if entries:
+                    with timed("log_write"):
+                        self._write(entries)
+            except Exception as e:
+                print(f"Chat log write failed: {e}")
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+            if batch[-1] is None:
+                return
+
+    def _write(self, entries):
+        by_day = {}
+        for entry in entries:
+            by_day.setdefault(entry[0].date(), []).append(entry)
+
+        for day, day_entries in sorted(by_day.items()):
+            if self._current_day is not None and day != self._current_day:
+                self._rotate_day(self._current_day)
+            self._current_day = day
+
+            md_path = get_log_file(day)
+            markdown = "".join(
+                format_markdown(role, content, ts.strftime("%Y-%m-%d %H:%M:%S")) for ts, role, content, _ in day_entries
+            )
+            with open(md_path, "a", encoding="utf-8") as f:
+                f.write(markdown)
+
+            if self.jsonl:
+                lines = "".join(
+                    json.dumps({"timestamp": ts.isoformat(timespec="seconds"), "role": role,
+                                "content": content, "session": session_id}, ensure_ascii=False) + "\n"
+                    for ts, role, content, session_id in day_entries
+                )
+                with open(get_log_file(day, "jsonl"), "a", encoding="utf-8") as f:
+                    f.write(lines)
+
+            if self.max_bytes and os.path.getsize(md_path) > self.max_bytes:
+                self._rotate_size(day)
+
+    def _rotate_size(self, day):
+        """Sposta il file del giorno in chat_log_DATE.N.md e riparte da un file vuoto."""
+        for extension in ("md", "jsonl"):
+            path = get_log_file(day, extension)
+            if not os.path.exists(path):
+                continue
+            base = path[: -len(extension) - 1]
+            n = 1
+            while os.path.exists(f"{base}.{n}.{extension}") or os.path.exists(f"{base}.{n}.{extension}.gz"):
+                n += 1
+            rotated = f"{base}.{n}.{extension}"
+            os.replace(path, rotated)
+            if self.compress:
+                _gzip_file(rotated)
+
+    def _rotate_day(self, day):
+        """A giorno finito, comprime i file di quel giorno."""
+        if not self.compress:
+            return
+        for extension in ("md", "jsonl"):
+            path = get_log_file(day, extension)
+            if os.path.exists(path):
+                _gzip_file(path)
+
+
+def _gzip_file(path):
+    try:
+        with open(path, "rb") as src, gzip.open(path + ".gz", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(path)
+    except Exception as e:
+        print(f"Chat log compression failed for {path}: {e}")
+
+
+writer = ChatLogWriter()
+
+
+def log_message(role, content, session_id=None):
+    writer.log(role, content, session_id)
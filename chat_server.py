@@ -0,0 +1,192 @@
+"""
+Server HTTP headless per il motore di chat (chat_engine.py).
+
+Usage:
+    python chat_server.py [--host 0.0.0.0] [--port 8000]
+
+Endpoints:
+    GET  /health
+    GET  /metrics                Prometheus histograms (metrics.py)
+    GET  /v1/models
+    POST /chat                   chat_engine events as Server-Sent Events
+    POST /v1/chat/completions    OpenAI-compatible, streaming or not
+
+/chat: {"message", "history", "model", "host", "use_web", "use_pool", "deep_context", "session_id"}.
+/v1/chat/completions accetta anche "web_search", "use_pool", "deep_context" e "host".
+"user" (o l'header X-Session-Id) e' la sessione; "user" e' anche il proprietario della memoria.
+"""
+import argparse
+import contextlib
+import json
+import os
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+from chat_engine import stream_chat, extract_text_from_content
+from context_window import context_manager
+from host_pool import host_pool, DEFAULT_HOSTS
+from page_fetch import DEEP_CONTEXT
+from metrics import registry as metrics_registry, CONTENT_TYPE as METRICS_CONTENT_TYPE
+
+# === CONFIGURAZIONE ===
+DEFAULT_OLLAMA_HOST = os.getenv("CHAT_SERVER_OLLAMA_HOST", DEFAULT_HOSTS[0])
+DEFAULT_USE_WEB = os.getenv("CHAT_SERVER_USE_WEB", "1") == "1"
+DEFAULT_USE_POOL = os.getenv("CHAT_SERVER_USE_POOL", "1") == "1"
+SAVE_LOGS = os.getenv("CHAT_SERVER_SAVE_LOGS", "1") == "1"
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    host_pool.add_host(DEFAULT_OLLAMA_HOST)
+    host_pool.start()
+    yield
+
+
+app = FastAPI(title="ollweb chat engine", lifespan=lifespan)
+
+
+def _sse(data, event=None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _session(body, request):
+    """Session id dato dal client, oppure una sessione usa e getta."""
+    session_id = body.get("session_id") or body.get("user") or request.headers.get("x-session-id")
+    if session_id:
+        return session_id, False
+    return f"api-{uuid.uuid4().hex}", True
+
+
+def _chat_args(body, request, message, history):
+    session_id, ephemeral = _session(body, request)
+    args = dict(
+        message=message,
+        history=history,
+        model=body.get("model"),
+        host=body.get("host") or DEFAULT_OLLAMA_HOST,
+        use_web=body.get("use_web", body.get("web_search", DEFAULT_USE_WEB)),
+        use_pool=body.get("use_pool", DEFAULT_USE_POOL),
+        deep_context=body.get("deep_context", DEEP_CONTEXT),
+        session_id=session_id,
+        save_logs=SAVE_LOGS,
+        owner=body.get("user"),
+    )
+    return args, ephemeral
+
+
+async def _events(args, ephemeral):
+    try:
+        async for event in stream_chat(**args):
+            yield event
+    finally:
+        if ephemeral:
+            context_manager.reset(args["session_id"])
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "hosts": {s.url: s.healthy for s in host_pool.hosts()}}
+
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(metrics_registry.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+@app.get("/v1/models")
+async def list_models():
+    models = sorted({m for s in host_pool.hosts() if s.healthy for m in s.models})
+    return {"object": "list", "data": [{"id": m, "object": "model", "owned_by": "ollama"} for m in models]}
+
+
+@app.post("/chat")
+async def chat(request: Request):
+    body = await request.json()
+    if not body.get("model") or not body.get("message"):
+        return JSONResponse({"error": "model e message sono obbligatori"}, status_code=400)
+    args, ephemeral = _chat_args(body, request, body["message"], body.get("history", []))
+
+    async def stream():
+        async for event in _events(args, ephemeral):
+            yield _sse(event, event["type"])
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+# === OPENAI-COMPATIBLE ===
+def _completion_chunk(completion_id, created, model, delta, finish_reason=None):
+    return {
+        "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+
+def _usage(usage):
+    prompt_tokens = usage.get("prompt_tokens", 0)
+    completion_tokens = usage.get("completion_tokens", 0)
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    messages = body.get("messages") or []
+    if not body.get("model") or not messages or messages[-1].get("role") != "user":
+        return JSONResponse({"error": {"message": "model e un ultimo messaggio 'user' sono obbligatori",
+                                       "type": "invalid_request_error"}}, status_code=400)
+    message = extract_text_from_content(messages[-1]["content"])
+    args, ephemeral = _chat_args(body, request, message, messages[:-1])
+    model = body["model"]
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+
+    if body.get("stream"):
+        async def stream():
+            yield "data: " + json.dumps(_completion_chunk(completion_id, created, model, {"role": "assistant"})) + "\n\n"
+            async for event in _events(args, ephemeral):
+                kind = event["type"]
+                if kind == "delta":
+                    chunk = _completion_chunk(completion_id, created, model, {"content": event["content"]})
+                elif kind in ("done", "cancelled"):
+                    chunk = _completion_chunk(completion_id, created, model, {}, "stop")
+                    if kind == "done":
+                        chunk["usage"] = _usage(event["usage"])
+                elif kind == "error":
+                    chunk = {"error": {"message": event["message"], "type": "server_error"}}
+                else:
+                    continue
+                yield "data: " + json.dumps(chunk, ensure_ascii=False) + "\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+    result = None
+    async for event in _events(args, ephemeral):
+        if event["type"] in ("done", "cancelled", "error"):
+            result = event
+    if result is None or result["type"] == "error":
+        message = result["message"] if result else "nessuna risposta"
+        return JSONResponse({"error": {"message": message, "type": "server_error"}}, status_code=502)
+    return {
+        "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": result["content"]}, "finish_reason": "stop"}],
+        "usage": _usage(result.get("usage", {})),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server HTTP del motore di chat")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Contesto web per rilevanza: le frasi migliori di tutti i risultati entro un budget di token.
+BM25 sulle frasi, duplicati scartati, almeno la frase migliore di ogni risultato.
+"""
+import os
+import re
+
+import numpy as np
+
+from context_window import CHARS_PER_TOKEN
+
+# === CONFIGURAZIONE ===
+WEB_CONTEXT_TOKENS = int(os.getenv("WEB_CONTEXT_TOKENS", "1000"))
+# With deep context (whole pages, page_fetch.py) there is more worth sending
+DEEP_CONTEXT_TOKENS = int(os.getenv("DEEP_CONTEXT_TOKENS", "2000"))
+BM25_K1 = 1.2
+BM25_B = 0.75
+DUPLICATE_SIMILARITY = 0.85  # cosine of term vectors above which two sentences say the same thing
+MIN_SENTENCE_CHARS = 25  # shorter pieces are joined to a neighbour
+MAX_SENTENCE_CHARS = 600
+
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+(?=[\"'«“(\[]?[A-ZÀ-Ý0-9])|\n+")
+# A period after these does not end the sentence
+ABBREVIATIONS = frozenset(
+    "sig sigg sigra dott dottssa prof ing avv arch geom rag on sen dr mr mrs ms st ecc etc es ca cfr "
+    "pag pp art nr vol cap fig tel vs no".split()
+)
+_WORD = re.compile(r"\w+", re.UNICODE)
+STOPWORDS = frozenset(
+    "il lo la i gli le un uno una di a da in con su per tra fra e o ma se che chi cui non del della dei delle "
+    "dello degli al alla ai alle allo agli dal dalla dai dalle nel nella nei nelle sul sulla sui sulle come "
+    "anche più piu è sono era ha hanno questo questa quello quella ci si ne mi ti vi "
+    "the a an of to in on for and or is are was were be by with as at from that this it".split()
+)
+
+
+def _ends_sentence(text, match):
+    """False per "U.S.A. ", "Dott. ", "3. 5": il punto non chiude la frase."""
+    if "\n" in match.group():
+        return True
+    word = text[:match.start()].rsplit(None, 1)[-1]
+    if not word.endswith("."):
+        return True
+    last = word.rstrip(".").rsplit(".", 1)[-1].lstrip("\"'«“([")
+    if len(last) == 1 and last.isupper():
+        return False
+    if last.lower() in ABBREVIATIONS:
+        return False
+    return not (last[-1:].isdigit() and text[match.end():match.end() + 1].isdigit())
+
+
+def split_sentences(text):
+    """Frasi di un testo; quelle troppo lunghe (elenchi senza punteggiatura) sono spezzate."""
+    pieces, start = [], 0
+    for match in _SENTENCE_END.finditer(text):
+        if _ends_sentence(text, match):
+            pieces.append(text[start:match.start()])
+            start = match.end()
+    pieces.append(text[start:])
+
+    sentences, short = [], ""
+    for piece in pieces:
+        piece = " ".join(f"{short} {piece}".split())
+        while len(piece) > MAX_SENTENCE_CHARS:
+            cut = piece.rfind(" ", 0, MAX_SENTENCE_CHARS)
+            cut = cut if cut > 0 else MAX_SENTENCE_CHARS
+            sentences.append(piece[:cut])
+            piece = piece[cut:].lstrip()
+        # A short fragment ("Roma.", "Sì.") rides along with the next sentence
+        short = piece if len(piece) < MIN_SENTENCE_CHARS else ""
+        if piece and not short:
+            sentences.append(piece)
+    if short:
+        if sentences:
+            sentences[-1] = f"{sentences[-1]} {short}"
+        else:
+            sentences.append(short)
+    return sentences
+
+
+def tokenize(text):
+    return [w for w in _WORD.findall(text.lower()) if len(w) > 1 and w not in STOPWORDS]
+
+
+def _term_matrix(token_lists, vocabulary):
+    """Matrice (frasi x termini) dei conteggi."""
+    rows, cols = [], []
+    for i, tokens in enumerate(token_lists):
+        for token in tokens:
+            rows.append(i)
+            cols.append(vocabulary.setdefault(token, len(vocabulary)))
+    counts = np.zeros((len(token_lists), len(vocabulary)), dtype=np.float32)
+    np.add.at(counts, (np.asarray(rows, dtype=np.intp), np.asarray(cols, dtype=np.intp)), 1.0)
+    return counts
+
+
+def bm25_scores(counts, query_columns):
+    """BM25 di ogni frase (riga di `counts`) per i termini della query."""
+    if not query_columns:
+        return np.zeros(counts.shape[0], dtype=np.float32)
+    lengths = counts.sum(axis=1)
+    average = lengths.mean() or 1.0
+    tf = counts[:, query_columns]
+    df = (tf > 0).sum(axis=0)
+    n = counts.shape[0]
+    idf = np.log1p((n - df + 0.5) / (df + 0.5))
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / average)
+    return (idf * tf * (BM25_K1 + 1) / (tf + norm[:, None])).sum(axis=1)
+
+
+def pack_context(query, results, token_budget=WEB_CONTEXT_TOKENS):
+    """
+    Restituisce (contesto, risultati usati). The context holds, for each
+    result that contributed, "title: sentences..." within `token_budget`.
+    """
+    sentences, owners = [], []
+    for index, result in enumerate(results):
+        for sentence in split_sentences(result.get("content") or ""):
+            sentences.append(sentence)
+            owners.append(index)
+    if not sentences:
+        return "", []
+
+    vocabulary = {}
+    counts = _term_matrix([tokenize(s) for s in sentences], vocabulary)
+    query_columns = sorted({vocabulary[t] for t in tokenize(query) if t in vocabulary})
+    scores = bm25_scores(counts, query_columns)
+    # Best score first; ties (e.g. no query term anywhere) keep SearXNG's order
+    order = np.lexsort((np.arange(len(sentences)), -scores))
+    # The best sentence of every result goes first, so no source is left out
+    _, leaders = np.unique(np.asarray(owners)[order], return_index=True)
+    leaders.sort()
+    order = np.concatenate([order[leaders], np.delete(order, leaders)])
+
+    norms = np.linalg.norm(counts, axis=1)
+    unit = counts / np.where(norms > 0, norms, 1.0)[:, None]
+    costs = np.ceil(np.fromiter((len(s) for s in sentences), dtype=np.float32) / CHARS_PER_TOKEN) + 1
+    headers = {}
+    used = 0
+    chosen = []
+    for i in order:
+        owner = owners[i]
+        header = 0 if owner in headers else int(np.ceil(len(results[owner].get("title") or "") / CHARS_PER_TOKEN)) + 2
+        cost = int(costs[i]) + header
+        if used + cost > token_budget:
+            continue  # a shorter sentence may still fit
+        if chosen and norms[i] > 0 and float((unit[chosen] @ unit[i]).max()) >= DUPLICATE_SIMILARITY:
+            continue
+        chosen.append(i)
+        headers[owner] = True
+        used += cost
+        if token_budget - used < 8:
+            break
+
+    by_result = {}
+    for i in sorted(chosen):
+        by_result.setdefault(owners[i], []).append(sentences[i])
+    parts = [f"{results[r].get('title', 'No Title')}: {' '.join(by_result[r])}" for r in sorted(by_result)]
+    return "\n\n".join(parts), [results[r] for r in sorted(by_result)]
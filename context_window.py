@@ -0,0 +1,161 @@
+import asyncio
+import contextlib
+import os
+import threading
+
+from ollama_pool import host_slot
+
+# === CONFIGURAZIONE ===
+# Prompt tokens allowed per request, and per-model overrides ("llama3.1:8b=8192,qwen2.5:0.5b=2048")
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "4096"))
+CONTEXT_BUDGET_MODELS = os.getenv("CONTEXT_BUDGET_MODELS", "")
+# Tokens kept free for web context and the answer
+CONTEXT_RESERVE_TOKENS = int(os.getenv("CONTEXT_RESERVE_TOKENS", "1536"))
+# When trimming, recent turns are cut down to this share of the history budget,
+# so the kept prefix stays identical for several turns (Ollama KV cache reuse)
+TRIM_TARGET_RATIO = 0.5
+CHARS_PER_TOKEN = 3.5  # rough average for Italian text
+MAX_SESSIONS = 1000
+
+SUMMARY_PROMPT = (
+    "Aggiorna il riassunto di una conversazione tra utente e assistente. "
+    "Conserva fatti, nomi, numeri e richieste dell'utente; massimo 150 parole, in italiano.\n\n"
+    "Riassunto precedente:\n{summary}\n\nNuovi messaggi:\n{messages}\n\nRiassunto aggiornato:"
+)
+
+
+def _parse_budgets(spec):
+    budgets = {}
+    for item in spec.split(","):
+        if "=" in item:
+            model, value = item.rsplit("=", 1)
+            budgets[model.strip()] = int(value)
+    return budgets
+
+
+model_budgets = _parse_budgets(CONTEXT_BUDGET_MODELS)
+
+
+def budget_for(model):
+    return model_budgets.get(model, CONTEXT_TOKEN_BUDGET)
+
+
+def estimate_tokens(text):
+    """Stima veloce senza tokenizer: ~3.5 caratteri per token per l'italiano."""
+    return int(len(text) / CHARS_PER_TOKEN) + 4
+
+
+# Summary tasks in flight: the event loop only keeps weak references to tasks
+_summary_tasks = set()
+
+
+class _Session:
+    def __init__(self):
+        self.cut = 0  # messages before this index are no longer sent verbatim
+        self.summary = ""
+        self.summarized = 0  # messages already folded into the summary
+        self.summarizing = False
+
+
+class ContextManager:
+    """
+    Tiene il prompt di ogni sessione entro il budget di token del modello.
+    I turni piu' vecchi diventano un riassunto, generato in background.
+    """
+
+    def __init__(self, reserve_tokens=CONTEXT_RESERVE_TOKENS):
+        self.reserve_tokens = reserve_tokens
+        self._lock = threading.Lock()
+        self._sessions = {}
+
+    def _session(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                if len(self._sessions) >= MAX_SESSIONS:
+                    self._sessions.pop(next(iter(self._sessions)))
+                session = self._sessions[session_id] = _Session()
+            return session
+
+    def reset(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def fit(self, session_id, model, messages, client=None, host=None):
+        """
+        `messages`: system prompt (opzionale) seguito dalla storia, l'ultimo e' il
+        messaggio corrente. Restituisce la lista da inviare a Ollama.
+        Con un client async il riassunto prende uno slot di `host`, come le chat.
+        """
+        has_system = bool(messages) and messages[0]["role"] == "system"
+        system_messages = messages[:1] if has_system else []
+        history = messages[1:] if has_system else list(messages)
+        session = self._session(session_id)
+        if session.cut > len(history):
+            # The UI history was cleared or replaced under this session
+            self.reset(session_id)
+            session = self._session(session_id)
+
+        budget = budget_for(model) - self.reserve_tokens - sum(estimate_tokens(m["content"]) for m in system_messages)
+        summary_tokens = estimate_tokens(session.summary) if session.summary else 0
+        sizes = [estimate_tokens(m["content"]) for m in history]
+
+        if sum(sizes[session.cut:]) + summary_tokens > budget:
+            # Cut down to the target, keeping at least the current message
+            target = budget * TRIM_TARGET_RATIO
+            cut = len(history) - 1
+            kept = sizes[cut]
+            while cut > session.cut and kept + sizes[cut - 1] <= target:
+                cut -= 1
+                kept += sizes[cut]
+            # Never start the kept window with an assistant answer
+            while cut < len(history) - 1 and history[cut]["role"] != "user":
+                cut += 1
+            session.cut = cut
+
+        if client is not None and session.summarized < session.cut and not session.summarizing:
+            self._schedule_summary(session, model, history[session.summarized:session.cut], client, host)
+
+        payload = list(system_messages)
+        if session.summary:
+            payload.append({"role": "system", "content": f"Riassunto della conversazione precedente:\n{session.summary}"})
+        payload.extend(history[session.cut:])
+        return payload
+
+    def _schedule_summary(self, session, model, new_messages, client, host=None):
+        session.summarizing = True
+        prompt = SUMMARY_PROMPT.format(
+            summary=session.summary or "(nessuno)",
+            messages="\n".join(f"{m['role']}: {m['content']}" for m in new_messages),
+        )
+        request = {"model": model, "messages": [{"role": "user", "content": prompt}], "options": {"temperature": 0}}
+        covered = session.summarized + len(new_messages)
+
+        def store(response):
+            session.summary = response["message"]["content"].strip()
+            session.summarized = covered
+
+        if asyncio.iscoroutinefunction(client.chat):
+            async def run_async():
+                try:
+                    async with host_slot(host) if host else contextlib.nullcontext():
+                        store(await client.chat(**request))
+                except Exception as e:
+                    print(f"Conversation summary failed: {e}")
+                finally:
+                    session.summarizing = False
+            task = asyncio.get_running_loop().create_task(run_async())
+            _summary_tasks.add(task)
+            task.add_done_callback(_summary_tasks.discard)
+        else:
+            def run():
+                try:
+                    store(client.chat(**request))
+                except Exception as e:
+                    print(f"Conversation summary failed: {e}")
+                finally:
+                    session.summarizing = False
+            threading.Thread(target=run, daemon=True).start()
+
+
+context_manager = ContextManager()
@@ -0,0 +1,203 @@
+import asyncio
+import contextlib
+import inspect
+import threading
+
+from metrics import registry as metrics_registry
+
+# === CONFIGURAZIONE ===
+# Chunks buffered between the Ollama stream and the UI; a full buffer pauses the reader
+STREAM_QUEUE_SIZE = 64
+# Expected answer length before any answer of the model has completed
+DEFAULT_EXPECTED_TOKENS = 400
+EXPECTED_SMOOTHING = 0.2  # weight of the newest answer in the running averages
+
+_END = object()
+
+
+class GenerationCancelled(Exception):
+    def __init__(self, reason):
+        super().__init__(f"generazione interrotta ({reason})")
+        self.reason = reason
+
+
+class Generation:
+    """
+    Una generazione in corso per una sessione.
+    `cancel()` chiude lo stream HTTP, cosi' Ollama smette di generare.
+    """
+
+    def __init__(self, session_id, model):
+        self.session_id = session_id
+        self.model = model
+        self.tokens = 0  # Ollama streams about one token per chunk
+        self.reason = None
+        self.done = False
+        self.eval_count = None
+        self.eval_duration = None
+        # Chunks Ollama had produced when this generation's cancel closed the stream;
+        # None if the stream went on (shared with other sessions) or was no Ollama stream
+        self.upstream_tokens = None
+        self._task = None
+
+    @property
+    def cancelled(self):
+        return self.reason is not None
+
+    def cancel(self, reason):
+        if self.done or self.reason is not None:
+            return False
+        self.reason = reason
+        if self._task is not None:
+            # Thread-safe: unload handlers may run outside the chat's loop
+            self._task.get_loop().call_soon_threadsafe(self._task.cancel)
+        return True
+
+    def closed_upstream(self, tokens):
+        self.upstream_tokens = tokens
+
+    def mark_done(self, eval_count=None, eval_duration=None):
+        self.done = True
+        self.eval_count = eval_count
+        self.eval_duration = eval_duration
+
+    async def stream(self, open_stream, slot=None):
+        """
+        Chunk di `open_stream()` (coroutine o async iterator), letti dal task
+        separato che tiene anche `slot` (es. ollama_pool.host_slot).
+        """
+        if self.cancelled:
+            raise GenerationCancelled(self.reason)
+        queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+
+        async def produce():
+            async with slot or contextlib.nullcontext():
+                source = open_stream()
+                if inspect.isawaitable(source):
+                    source = await source
+                try:
+                    async for chunk in source:
+                        await queue.put(chunk)
+                finally:
+                    if hasattr(source, "aclose"):
+                        await source.aclose()
+            await queue.put(_END)
+
+        task = asyncio.create_task(produce())
+        self._task = task
+        try:
+            while True:
+                getter = asyncio.ensure_future(queue.get())
+                await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+                if not getter.done():
+                    getter.cancel()
+                    if task.cancelled():
+                        raise GenerationCancelled(self.reason or "annullata")
+                    # The producer failed (or ended): drain, then surface its error
+                    while not queue.empty():
+                        chunk = queue.get_nowait()
+                        if chunk is _END:
+                            return
+                        self.tokens += 1
+                        yield chunk
+                    task.result()
+                    return
+                chunk = getter.result()
+                if chunk is _END:
+                    return
+                self.tokens += 1
+                yield chunk
+        finally:
+            if not task.done():
+                task.cancel()
+                with contextlib.suppress(BaseException):
+                    await task
+            self._task = None
+
+
+class GenerationRegistry:
+    """
+    Generazioni attive per sessione e metriche delle interruzioni.
+    I token risparmiati contano solo se l'interruzione ha chiuso lo stream di Ollama.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = {}
+        self._expected_tokens = {}  # model -> running average of eval_count
+        self._tokens_per_second = {}  # model -> running average decode speed
+        self.stats = {
+            "completed": 0, "cancelled": 0, "failed": 0, "reasons": {},
+            "tokens_before_cancel": 0, "tokens_saved": 0, "seconds_saved": 0.0,
+        }
+
+    def begin(self, session_id, model):
+        generation = Generation(session_id, model)
+        with self._lock:
+            previous = self._active.get(session_id)
+            self._active[session_id] = generation
+        if previous is not None:
+            previous.cancel("nuovo messaggio")
+        return generation
+
+    def cancel(self, session_id, reason):
+        with self._lock:
+            generation = self._active.get(session_id)
+        return generation is not None and generation.cancel(reason)
+
+    def finish(self, generation):
+        """Da chiamare sempre a fine generazione (completata, interrotta o fallita)."""
+        with self._lock:
+            if self._active.get(generation.session_id) is generation:
+                del self._active[generation.session_id]
+            model = generation.model
+            if generation.done:
+                self.stats["completed"] += 1
+                if generation.eval_count:
+                    self._expected_tokens[model] = _smooth(self._expected_tokens.get(model), generation.eval_count)
+                    if generation.eval_duration:
+                        speed = generation.eval_count / (generation.eval_duration / 1e9)
+                        self._tokens_per_second[model] = _smooth(self._tokens_per_second.get(model), speed)
+                return
+            if generation.reason is None:
+                self.stats["failed"] += 1
+                return
+            reason = generation.reason
+            expected = self._expected_tokens.get(model, DEFAULT_EXPECTED_TOKENS)
+            saved = 0
+            if generation.upstream_tokens is not None:
+                saved = max(0, round(expected - generation.upstream_tokens))
+            seconds = saved / self._tokens_per_second[model] if self._tokens_per_second.get(model) else 0.0
+            self.stats["cancelled"] += 1
+            self.stats["reasons"][reason] = self.stats["reasons"].get(reason, 0) + 1
+            self.stats["tokens_before_cancel"] += generation.tokens
+            self.stats["tokens_saved"] += saved
+            self.stats["seconds_saved"] += seconds
+
+    def snapshot(self):
+        with self._lock:
+            return {**self.stats, "reasons": dict(self.stats["reasons"]), "active": len(self._active)}
+
+    def summary_markdown(self):
+        s = self.stats
+        return (f"*Generazioni: {s['completed']} completate / {s['cancelled']} interrotte · "
+                f"~{s['tokens_saved']} token risparmiati (~{s['seconds_saved']:.0f}s)*")
+
+
+def _smooth(previous, value):
+    return value if previous is None else previous + EXPECTED_SMOOTHING * (value - previous)
+
+
+generations = GenerationRegistry()
+
+metrics_registry.gauge(
+    "ollweb_generations_total", "Generazioni concluse per esito",
+    lambda: {k: v for k, v in generations.snapshot().items() if k in ("completed", "cancelled", "failed")},
+    label="outcome", metric_type="counter",
+)
+metrics_registry.gauge("ollweb_generations_active", "Generazioni in corso",
+                       lambda: generations.snapshot()["active"])
+metrics_registry.gauge("ollweb_cancel_tokens_saved_total", "Token stimati non generati grazie alle interruzioni",
+                       lambda: generations.snapshot()["tokens_saved"], metric_type="counter")
+metrics_registry.gauge("ollweb_cancel_seconds_saved_total", "Secondi GPU stimati risparmiati dalle interruzioni",
+                       lambda: generations.snapshot()["seconds_saved"], metric_type="counter")
@@ -0,0 +1,191 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from ollama_pool import host_limiter
+
+# === CONFIGURAZIONE ===
+DEFAULT_HOSTS = ["http://localhost:11434", "http://192.168.1.125:11434"]
+# Extra hosts, comma separated
+OLLAMA_HOSTS = [h.strip().rstrip("/") for h in os.getenv("OLLAMA_HOSTS", "").split(",") if h.strip()]
+HEALTH_INTERVAL = float(os.getenv("OLLAMA_HEALTH_INTERVAL", "10"))
+HEALTH_TIMEOUT = 2
+# Cached status older than this is refreshed in the background on read
+STATUS_TTL = HEALTH_INTERVAL * 3
+# Hosts typed in a UI are not pool members: forgotten after this long unused
+ADHOC_EXPIRY = 600
+# A host that failed a request is skipped for this long, even if /api/tags answers
+FAILURE_COOLDOWN = 30
+API_KEY = os.getenv("OLLAMA_API_KEY")
+HEADERS = {"Authorization": f"Bearer {API_KEY}"} if API_KEY else {}
+
+
+class HostState:
+    def __init__(self, url):
+        self.url = url
+        self.healthy = False
+        self.models = []
+        self.running = set()
+        self.checked_at = 0.0
+        self.failed_at = 0.0
+        self.used_at = 0.0
+        self.version = 0  # bumped whenever health, models or running models change
+
+    def in_flight(self):
+        return host_limiter.running.get(self.url, 0) + host_limiter.waiting.get(self.url, 0)
+
+
+class HostPool:
+    """
+    Pool di host Ollama con health check in background.
+    Le letture non bloccano mai. Gli host inseriti dagli utenti restano
+    fuori dal pool e scadono dopo ADHOC_EXPIRY.
+    """
+
+    def __init__(self, hosts=None, interval=HEALTH_INTERVAL):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._hosts = {}  # pool members: polled, used by candidates()
+        self._adhoc = {}  # hosts chosen in a UI
+        self._checking = set()
+        self._check_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="ollama-check")
+        for url in hosts or DEFAULT_HOSTS + OLLAMA_HOSTS:
+            self.add_host(url)
+        self._thread = None
+
+    def add_host(self, url):
+        """Aggiunge un host al pool (solo da configurazione, non da input utente)."""
+        url = url.rstrip("/")
+        with self._lock:
+            if url not in self._hosts:
+                self._hosts[url] = self._adhoc.pop(url, None) or HostState(url)
+
+    def hosts(self):
+        with self._lock:
+            return list(self._hosts.values())
+
+    def start(self):
+        """Avvia il thread di health check (idempotente)."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="ollama-health", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self.check_all()
+            time.sleep(self.interval)
+
+    def check_all(self):
+        states = self.hosts()
+        with ThreadPoolExecutor(max_workers=max(1, len(states))) as executor:
+            list(executor.map(self.check, states))
+
+    def check(self, state):
+        try:
+            r = requests.get(f"{state.url}/api/tags", headers=HEADERS, timeout=HEALTH_TIMEOUT)
+            healthy = r.status_code == 200
+            models = [m.get("model") or m.get("name") for m in r.json().get("models", [])] if healthy else []
+            running = set()
+            if healthy:
+                ps = requests.get(f"{state.url}/api/ps", headers=HEADERS, timeout=HEALTH_TIMEOUT)
+                if ps.status_code == 200:
+                    running = {m.get("model") or m.get("name") for m in ps.json().get("models", [])}
+        except Exception:
+            healthy, models, running = False, [], set()
+        with self._lock:
+            if (healthy, models, running) != (state.healthy, state.models, state.running):
+                state.version += 1
+            state.healthy = healthy
+            state.models = models
+            state.running = running
+            state.checked_at = time.time()
+
+    def _check_later(self, state):
+        with self._lock:
+            if state.url in self._checking:
+                return
+            self._checking.add(state.url)
+
+        def run():
+            try:
+                self.check(state)
+            finally:
+                with self._lock:
+                    self._checking.discard(state.url)
+
+        self._check_executor.submit(run)
+
+    # === LETTURE DALLA CACHE ===
+    def _lookup(self, url):
+        url = url.rstrip("/")
+        now = time.time()
+        with self._lock:
+            state = self._hosts.get(url)
+            if state is not None:
+                return state, STATUS_TTL
+            for old in [u for u, s in self._adhoc.items() if now - s.used_at > ADHOC_EXPIRY]:
+                del self._adhoc[old]
+            state = self._adhoc.get(url)
+            if state is None:
+                state = self._adhoc[url] = HostState(url)
+            state.used_at = now
+        # Not polled by the monitor: re-check as often as it would
+        return state, self.interval
+
+    def state(self, url):
+        """Stato in cache dell'host, senza attese; se e' vecchio parte un controllo in background."""
+        self.start()
+        state, max_age = self._lookup(url)
+        if time.time() - state.checked_at > max_age:
+            self._check_later(state)
+        return state
+
+    def cached(self, url):
+        """Ultimo stato visto dal monitor, senza controlli (None se l'host non e' nel pool)."""
+        with self._lock:
+            return self._hosts.get(url.rstrip("/"))
+
+    def is_healthy(self, url):
+        return self.state(url).healthy
+
+    def models(self, url):
+        return list(self.state(url).models)
+
+    def is_running(self, url, model):
+        return model in self.state(url).running
+
+    def refresh(self, url):
+        """Ricontrolla subito l'host (es. pulsante "Aggiorna Modelli")."""
+        state, _ = self._lookup(url)
+        self.check(state)
+        return state
+
+    def mark_failed(self, url):
+        """Segnala un errore di richiesta: l'host viene saltato per FAILURE_COOLDOWN secondi."""
+        with self._lock:
+            state = self._hosts.get(url.rstrip("/"))
+            if state is not None:
+                state.failed_at = time.monotonic()
+
+    def candidates(self, model):
+        now = time.monotonic()
+        with self._lock:
+            usable = [
+                s for s in self._hosts.values()
+                if s.healthy and model in s.models and now - s.failed_at > FAILURE_COOLDOWN
+            ]
+        usable.sort(key=lambda s: (s.in_flight(), model not in s.running))
+        return [s.url for s in usable]
+
+    def status_markdown(self):
+        lines = []
+        for s in self.hosts():
+            icon = "🟢" if s.healthy else "🔴"
+            lines.append(f"{icon} `{s.url}` · in corso: {s.in_flight()} · modelli: {len(s.models)}")
+        return "\n\n".join(lines)
+
+
+host_pool = HostPool()
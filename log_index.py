@@ -0,0 +1,228 @@
+"""
+Indice full-text (SQLite FTS5) dei log giornalieri della chat.
+
+Usage:
+    python log_index.py index                 # index new entries of chat_log_*.md
+    python log_index.py search "parole"       # index, then search
+"""
+import argparse
+import glob
+import gzip
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from chat_logger import LOG_DIR
+
+# === CONFIGURAZIONE ===
+LOG_INDEX_DB = os.getenv("CHAT_LOG_INDEX", os.path.join(LOG_DIR, "chat_log_index.sqlite3"))
+# Searches from the UI re-index at most this often, and only if a log file changed
+REINDEX_SECONDS = float(os.getenv("CHAT_LOG_REINDEX_SECONDS", "10"))
+# Pipeline bookkeeping written by chat_engine, not conversation
+SKIPPED_ROLES = frozenset({"SearXNG Gate", "SearXNG Search", "SearXNG Pagine"})
+
+# Header written by chat_logger.format_markdown
+ENTRY_HEADER = re.compile(r"^### (.+?) \((\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\)\n", re.MULTILINE)
+# Sentinel offset for compressed files, which never grow once written
+COMPLETE = -1
+# chat_log_DATE.md and its archives: .md.gz (day over), .N.md / .N.md.gz (rotated by size)
+LOG_NAME = re.compile(r"^(chat_log_\d{4}-\d{2}-\d{2})(?:\.\d+)?\.md(?:\.gz)?$")
+
+
+def parse_entries(text):
+    """
+    Divide il testo in voci (ruolo, timestamp, contenuto) e restituisce anche
+    quanti caratteri sono stati consumati. L'ultima voce senza riga vuota finale
+    puo' essere a meta': resta per il giro successivo.
+    """
+    headers = list(ENTRY_HEADER.finditer(text))
+    entries = []
+    consumed = 0
+    for i, match in enumerate(headers):
+        if i + 1 < len(headers):
+            end = headers[i + 1].start()
+        elif text.endswith("\n\n"):
+            end = len(text)
+        else:
+            break
+        entries.append((match.group(1), match.group(2), text[match.end():end].strip("\n")))
+        consumed = end
+    return entries, consumed
+
+
+def quote_query(query):
+    """Ogni parola diventa un termine FTS5 tra virgolette (niente errori di sintassi)."""
+    terms = [term.replace('"', '""') for term in query.split()]
+    return " ".join(f'"{term}"' for term in terms)
+
+
+class LogIndex:
+    """
+    Indicizza in modo incrementale le voci `### Ruolo (timestamp)` dei log.
+    Per ogni file salva l'offset gia' letto; gli archivi (.md.gz, .N.md.gz) riprendono da quello del .md.
+    """
+
+    def __init__(self, db_path=LOG_INDEX_DB, log_dir=LOG_DIR):
+        self.db_path = db_path
+        self.log_dir = log_dir
+        self._lock = threading.Lock()  # one indexing run at a time
+        self._seen = None  # (name, size, mtime) of the log files at the last run
+        self._indexed_at = 0.0
+        with self._connect() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, offset INTEGER NOT NULL)")
+            db.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS entries USING fts5("
+                "role, timestamp UNINDEXED, content, file UNINDEXED, tokenize='unicode61 remove_diacritics 2')"
+            )
+            db.execute(f"DELETE FROM entries WHERE role IN ({','.join('?' * len(SKIPPED_ROLES))})", sorted(SKIPPED_ROLES))
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path)
+
+    def _log_files(self):
+        paths = glob.glob(os.path.join(self.log_dir, "chat_log_*.md"))
+        paths += glob.glob(os.path.join(self.log_dir, "chat_log_*.md.gz"))
+        return sorted(paths)
+
+    def _signature(self, paths):
+        signature = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue  # rotated away meanwhile
+            signature.append((path, st.st_size, st.st_mtime_ns))
+        return tuple(signature)
+
+    def index_if_changed(self, min_interval=REINDEX_SECONDS):
+        """Come `index`, ma solo se sono passati `min_interval` secondi e un log e' cambiato."""
+        if time.monotonic() - self._indexed_at < min_interval:
+            return 0
+        if self._signature(self._log_files()) == self._seen:
+            self._indexed_at = time.monotonic()
+            return 0
+        return self.index()
+
+    def index(self):
+        """Indicizza le voci nuove; restituisce quante ne sono state aggiunte."""
+        with self._lock, self._connect() as db:
+            offsets = dict(db.execute("SELECT path, offset FROM files"))
+            added = 0
+            paths = self._log_files()
+            seen = self._signature(paths)
+            for path in paths:
+                name = os.path.basename(path)
+                if name.endswith(".gz") and (offsets.get(name) == COMPLETE or os.path.exists(path[:-3])):
+                    continue  # done, or still being compressed
+                match = LOG_NAME.match(name)
+                live = f"{match.group(1)}.md" if match else name
+                if name != live and name not in offsets:
+                    # A new archive holds what the day's .md had: continue from its offset,
+                    # and the .md that replaced it starts again from zero
+                    start = offsets.pop(live, 0)
+                    db.execute("DELETE FROM files WHERE path = ?", (live,))
+                else:
+                    start = offsets.get(name, 0)
+
+                if name.endswith(".gz"):
+                    with gzip.open(path, "rb") as f:
+                        f.seek(start)
+                        data = f.read()
+                    entries, _ = parse_entries(data.decode("utf-8", errors="replace") + "\n\n")
+                    new_offset = COMPLETE
+                else:
+                    size = os.path.getsize(path)
+                    if size < start:
+                        # Rotated by size: the old content is reindexed from the .N.md.gz
+                        db.execute("DELETE FROM entries WHERE file = ?", (name,))
+                        start = 0
+                    if size <= start:
+                        continue
+                    with open(path, "rb") as f:
+                        f.seek(start)
+                        data = f.read()
+                    text = data.decode("utf-8", errors="replace")
+                    entries, consumed = parse_entries(text)
+                    new_offset = start + len(text[:consumed].encode("utf-8"))
+
+                entries = [(role, ts, content, name) for role, ts, content in entries if role not in SKIPPED_ROLES]
+                db.executemany("INSERT INTO entries (role, timestamp, content, file) VALUES (?, ?, ?, ?)", entries)
+                db.execute("INSERT OR REPLACE INTO files (path, offset) VALUES (?, ?)", (name, new_offset))
+                added += len(entries)
+            self._seen = seen
+            self._indexed_at = time.monotonic()
+            return added
+
+    def search(self, query, limit=20, role=None):
+        """Voci piu' rilevanti per `query` (ranking bm25), con snippet evidenziato."""
+        if not query.strip():
+            return []
+        sql = ("SELECT role, timestamp, file, snippet(entries, 2, '**', '**', '…', 24) "
+               "FROM entries WHERE entries MATCH ?")
+        params = [quote_query(query)]
+        if role:
+            sql += " AND role = ?"
+            params.append(role)
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(limit)
+        with self._connect() as db:
+            rows = db.execute(sql, params).fetchall()
+        return [{"role": r[0], "timestamp": r[1], "file": r[2], "snippet": r[3]} for r in rows]
+
+
+def format_results_markdown(results, elapsed_ms):
+    if not results:
+        return f"Nessun risultato ({elapsed_ms:.0f} ms)"
+    lines = [f"*{len(results)} risultati in {elapsed_ms:.0f} ms*", ""]
+    for r in results:
+        lines.append(f"- **{r['role']}** ({r['timestamp']}): {r['snippet']}")
+    return "\n".join(lines)
+
+
+_index = None
+
+
+def get_index():
+    global _index
+    if _index is None:
+        _index = LogIndex()
+    return _index
+
+
+def search_logs(query, limit=20):
+    """Aggiorna l'indice se i log sono cambiati e cerca; restituisce (risultati, millisecondi della query)."""
+    index = get_index()
+    index.index_if_changed()
+    start = time.perf_counter()
+    results = index.search(query, limit)
+    return results, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Indice full-text dei log della chat")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("index", help="indicizza le voci nuove")
+    search_parser = sub.add_parser("search", help="cerca nei log")
+    search_parser.add_argument("query")
+    search_parser.add_argument("--limit", type=int, default=20)
+    search_parser.add_argument("--role", help="Utente o Assistente")
+    args = parser.parse_args()
+
+    index = get_index()
+    added = index.index()
+    if args.command == "index":
+        print(f"{added} nuove voci indicizzate")
+        return
+
+    start = time.perf_counter()
+    results = index.search(args.query, args.limit, args.role)
+    elapsed = (time.perf_counter() - start) * 1000
+    for r in results:
+        print(f"[{r['timestamp']}] {r['role']} ({r['file']}): {r['snippet']}")
+    print(f"{len(results)} risultati in {elapsed:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from context_window import estimate_tokens
+
+# === CONFIGURAZIONE ===
+# Opt-in; memories are kept per owner (logged-in user), sessions without one get none
+MEMORY_ENABLED = os.getenv("MEMORY_ENABLED", "0") == "1"
+MEMORY_DIR = os.getenv("MEMORY_DIR", "memory")
+MEMORY_EMBED_MODEL = os.getenv("MEMORY_EMBED_MODEL", "nomic-embed-text")
+MEMORY_TOP_K = int(os.getenv("MEMORY_TOP_K", "4"))
+MEMORY_MIN_SIMILARITY = float(os.getenv("MEMORY_MIN_SIMILARITY", "0.35"))
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "600"))
+EMBED_CACHE_SIZE = 2048
+INITIAL_CAPACITY = 1024
+# After an embedding error (e.g. model not pulled) memory is skipped for a while
+RETRY_AFTER_SECONDS = 300
+MAX_MEMORY_CHARS = 1200
+
+
+class EmbeddingCache:
+    """Embedding per testo (hash SHA-1), cosi' ogni testo viene calcolato una sola volta."""
+
+    def __init__(self, max_entries=EMBED_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._vectors = OrderedDict()
+
+    @staticmethod
+    def key(model, text):
+        return hashlib.sha1(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def get(self, model, text):
+        key = self.key(model, text)
+        with self._lock:
+            vector = self._vectors.get(key)
+            if vector is not None:
+                self._vectors.move_to_end(key)
+            return vector
+
+    def put(self, model, text, vector):
+        with self._lock:
+            self._vectors[self.key(model, text)] = vector
+            while len(self._vectors) > self.max_entries:
+                self._vectors.popitem(last=False)
+
+
+class MemoryStore:
+    """
+    Memoria a lungo termine per utente: turni passati indicizzati per embedding.
+    Vettori normalizzati in una matrice memory-mapped, testi in memories.jsonl.
+    """
+
+    def __init__(self, directory=MEMORY_DIR, embed_model=MEMORY_EMBED_MODEL):
+        self.directory = directory
+        self.embed_model = embed_model
+        self.cache = EmbeddingCache()
+        self._lock = threading.Lock()
+        self._disabled_until = 0.0
+        self.dim = None
+        self.count = 0
+        self.capacity = 0
+        self._vectors = None
+        self._meta = []
+        self._load()
+
+    # --- storage ---
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _load(self):
+        if not os.path.exists(self._path("index.json")):
+            return
+        with open(self._path("index.json"), encoding="utf-8") as f:
+            header = json.load(f)
+        self.dim, self.count, self.capacity = header["dim"], header["count"], header["capacity"]
+        self._vectors = np.memmap(self._path("vectors.f32"), dtype=np.float32, mode="r+", shape=(self.capacity, self.dim))
+        with open(self._path("memories.jsonl"), encoding="utf-8") as f:
+            self._meta = [json.loads(line) for line in f][: self.count]
+
+    def _write_header(self):
+        with open(self._path("index.json"), "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "count": self.count, "capacity": self.capacity}, f)
+
+    def _ensure_capacity(self, needed):
+        if self._vectors is not None and needed <= self.capacity:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        new_capacity = max(INITIAL_CAPACITY, self.capacity * 2, needed)
+        path = self._path("vectors.f32")
+        if self._vectors is not None:
+            self._vectors.flush()
+            del self._vectors
+        # Growing the file keeps existing rows in place
+        with open(path, "ab") as f:
+            f.truncate(new_capacity * self.dim * 4)
+        self.capacity = new_capacity
+        self._vectors = np.memmap(path, dtype=np.float32, mode="r+", shape=(self.capacity, self.dim))
+
+    # --- embeddings ---
+    def _available(self):
+        return MEMORY_ENABLED and time.monotonic() >= self._disabled_until
+
+    def embed(self, client, texts):
+        """Embedding normalizzati per `texts`, chiamando Ollama solo per quelli non in cache."""
+        vectors = [self.cache.get(self.embed_model, t) for t in texts]
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            response = client.embed(model=self.embed_model, input=[texts[i] for i in missing])
+            embeddings = response["embeddings"]
+            for i, embedding in zip(missing, embeddings):
+                vector = np.asarray(embedding, dtype=np.float32)
+                vector /= np.linalg.norm(vector) or 1.0
+                self.cache.put(self.embed_model, texts[i], vector)
+                vectors[i] = vector
+        return np.vstack(vectors)
+
+    def _guard(self, action, *args):
+        if not self._available():
+            return None
+        try:
+            return action(*args)
+        except Exception as e:
+            print(f"Memory disabled for {RETRY_AFTER_SECONDS}s: {e}")
+            self._disabled_until = time.monotonic() + RETRY_AFTER_SECONDS
+            return None
+
+    # --- API ---
+    def enabled_for(self, owner):
+        return MEMORY_ENABLED and bool(owner)
+
+    def add_turn(self, client, user_text, assistant_text, owner, session_id=None):
+        """Memorizza un turno (domanda + risposta) con un solo embedding."""
+        if not self.enabled_for(owner):
+            return
+        text = f"Utente: {user_text}\nAssistente: {assistant_text}"[:MAX_MEMORY_CHARS]
+        self._guard(self._add, client, text, owner, session_id)
+
+    def _add(self, client, text, owner, session_id):
+        vector = self.embed(client, [text])[0]
+        with self._lock:
+            if self.dim is None:
+                self.dim = vector.shape[0]
+            elif vector.shape[0] != self.dim:
+                raise ValueError(f"embedding dimension {vector.shape[0]} != {self.dim}")
+            self._ensure_capacity(self.count + 1)
+            self._vectors[self.count] = vector
+            self._vectors.flush()
+            meta = {"text": text, "owner": owner, "session": session_id, "timestamp": datetime.datetime.now().isoformat(timespec="seconds")}
+            with open(self._path("memories.jsonl"), "a", encoding="utf-8") as f:
+                f.write(json.dumps(meta, ensure_ascii=False) + "\n")
+            self._meta.append(meta)
+            self.count += 1
+            self._write_header()
+
+    def search(self, client, query, owner, k=MEMORY_TOP_K, exclude_session=None):
+        """Top-k memorie di `owner` per similarita' coseno con `query`: lista di (score, meta)."""
+        if self.count == 0 or not self.enabled_for(owner):
+            return []
+        result = self._guard(self._search, client, query, owner, k, exclude_session)
+        return result or []
+
+    def _search(self, client, query, owner, k, exclude_session):
+        query_vector = self.embed(client, [query])[0]
+        with self._lock:
+            scores = np.asarray(self._vectors[: self.count] @ query_vector)
+            meta = self._meta
+        # Other owners' memories, and turns of the current session (already in the prompt)
+        skip = np.fromiter(
+            (m.get("owner") != owner or (exclude_session is not None and m.get("session") == exclude_session) for m in meta), dtype=bool, count=len(scores)
+        )
+        scores = np.where(skip, -1.0, scores)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), meta[i]) for i in top if scores[i] >= MEMORY_MIN_SIMILARITY]
+
+    def inject(self, client, messages, query, owner, session_id=None, token_budget=MEMORY_TOKEN_BUDGET):
+        """
+        Aggiunge i ricordi pertinenti come messaggio di sistema subito prima
+        della domanda corrente: the history prefix stays unchanged (KV cache)
+        and the memories sit next to the question they are about.
+        """
+        memories = self.search(client, query, owner, exclude_session=session_id)
+        lines, used = [], 0
+        for _, meta in memories:
+            line = f"- ({meta['timestamp'][:10]}) {meta['text']}"
+            cost = estimate_tokens(line)
+            if used + cost > token_budget:
+                break
+            lines.append(line)
+            used += cost
+        if not lines:
+            return messages
+        note = {"role": "system", "content": "Ricordi da conversazioni passate (usali solo se pertinenti):\n" + "\n".join(lines)}
+        return messages[:-1] + [note] + messages[-1:]
+
+
+memory = MemoryStore()
@@ -0,0 +1,152 @@
+import contextlib
+import os
+import threading
+import time
+
+# === CONFIGURAZIONE ===
+# Show a per-turn timing footer under each answer (debug)
+METRICS_FOOTER = os.getenv("METRICS_FOOTER", "0") == "1"
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 250, 500, 1000, 2500)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Histogram:
+    """Istogramma cumulativo nel formato testuale di Prometheus."""
+
+    def __init__(self, name, documentation, buckets=SECONDS_BUCKETS, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for key, values in sorted(series.items()):
+            for bound, count in zip(self.buckets, values):
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, [('le', bound)])} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, [('le', '+Inf')])} {values[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {values[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {values[-1]}")
+        return "\n".join(lines)
+
+
+class Gauge:
+    """Valore letto a ogni scrape da `read()`: un numero, o un dict {valore etichetta: numero}."""
+
+    def __init__(self, name, documentation, read, label=None, metric_type="gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+        self.label = label
+        self.metric_type = metric_type
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        value = self.read()
+        if self.label is None:
+            lines.append(f"{self.name} {value}")
+        else:
+            for key, v in sorted(value.items()):
+                lines.append(f"{self.name}{_format_labels((self.label,), (key,))} {v}")
+        return "\n".join(lines)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def histogram(self, *args, **kwargs):
+        metric = Histogram(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, *args, **kwargs):
+        metric = Gauge(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        return "\n".join(m.render() for m in self._metrics) + "\n"
+
+
+registry = Registry()
+
+stage_seconds = registry.histogram(
+    "ollweb_stage_seconds", "Durata delle fasi della pipeline di chat", labels=("stage",)
+)
+ttft_seconds = registry.histogram(
+    "ollweb_time_to_first_token_seconds", "Dall'apertura dello stream Ollama al primo token", labels=("model",)
+)
+decode_rate = registry.histogram(
+    "ollweb_decode_tokens_per_second", "eval_count / eval_duration dell'ultimo chunk Ollama",
+    buckets=RATE_BUCKETS, labels=("model",)
+)
+prompt_eval_rate = registry.histogram(
+    "ollweb_prompt_eval_tokens_per_second", "prompt_eval_count / prompt_eval_duration dell'ultimo chunk Ollama",
+    buckets=RATE_BUCKETS, labels=("model",)
+)
+turn_seconds = registry.histogram("ollweb_turn_seconds", "Durata totale di un turno di chat", labels=("model",))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@contextlib.contextmanager
+def timed(stage, timings=None):
+    """Misura un blocco come fase `stage`; se dato, salva i secondi anche in `timings`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        stage_seconds.observe(seconds, stage=stage)
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+def observe_generation(model, timings, ttft, prompt_eval_count, prompt_eval_duration, eval_count, eval_duration):
+    """Metriche di Ollama dal chunk finale (durate in nanosecondi)."""
+    if ttft is not None:
+        ttft_seconds.observe(ttft, model=model)
+        timings["ttft"] = ttft
+    if prompt_eval_count and prompt_eval_duration:
+        stage_seconds.observe(prompt_eval_duration / 1e9, stage="ollama_prompt_eval")
+        timings["prompt_eval"] = prompt_eval_duration / 1e9
+        prompt_eval_rate.observe(prompt_eval_count / (prompt_eval_duration / 1e9), model=model)
+    if eval_count and eval_duration:
+        stage_seconds.observe(eval_duration / 1e9, stage="ollama_decode")
+        timings["decode_tokens_per_second"] = eval_count / (eval_duration / 1e9)
+        decode_rate.observe(timings["decode_tokens_per_second"], model=model)
+
+
+def format_footer(timings):
+    """Riga di debug con i tempi del turno."""
+    labels = [("gate", "gate"), ("search", "ricerca"), ("deep_fetch", "pagine"), ("prompt", "prompt"), ("ttft", "TTFT"),
+              ("prompt_eval", "prompt eval"), ("total", "totale")]
+    parts = [f"{label} {timings[key]:.2f}s" for key, label in labels if key in timings]
+    if "decode_tokens_per_second" in timings:
+        parts.append(f"{timings['decode_tokens_per_second']:.0f} tok/s")
+    return "⏱️ " + " · ".join(parts)
@@ -0,0 +1,90 @@
+import os
+import threading
+import time
+
+# === CONFIGURAZIONE ===
+# How long Ollama keeps a model in memory after the last request (Ollama duration syntax, -1 = forever)
+KEEP_ALIVE_DEFAULT = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# Per-model overrides, e.g. "llama3.1:8b=2h,qwen2.5:0.5b=-1"
+KEEP_ALIVE_MODELS = os.getenv("OLLAMA_KEEP_ALIVE_MODELS", "")
+
+
+def _parse_keep_alive_policy(spec):
+    policy = {}
+    for item in spec.split(","):
+        if "=" in item:
+            model, value = item.rsplit("=", 1)
+            value = value.strip()
+            # Plain numbers are seconds for Ollama, anything else is a duration string
+            policy[model.strip()] = int(value) if value.lstrip("-").isdigit() else value
+    return policy
+
+
+keep_alive_policy = _parse_keep_alive_policy(KEEP_ALIVE_MODELS)
+
+
+def keep_alive_for(model):
+    return keep_alive_policy.get(model, KEEP_ALIVE_DEFAULT)
+
+
+async def warm_up(client, host_url, model, prefix_messages):
+    """
+    Carica il modello e pre-calcola il prefisso stabile della conversazione
+    (system prompt + storia) durante la ricerca web. Restituisce i secondi impiegati.
+    Non prende uno slot dell'host: e' una richiesta da un token, e il turno non la attende.
+    """
+    start = time.perf_counter()
+    try:
+        await client.chat(
+            model=model, messages=prefix_messages, options={"num_predict": 1}, keep_alive=keep_alive_for(model)
+        )
+    except Exception as e:
+        print(f"Model warm-up failed: {e}")
+    return time.perf_counter() - start
+
+
+# === PRELOAD ALLA SELEZIONE DEL MODELLO ===
+def preload(client, model):
+    """Carica il modello in memoria con la policy di keep_alive configurata."""
+    try:
+        # An empty prompt makes Ollama load the model without generating anything
+        client.generate(model=model, prompt="", keep_alive=keep_alive_for(model))
+        return True
+    except Exception as e:
+        print(f"Model preload failed for {model}: {e}")
+        return False
+
+
+async def preload_async(client, model):
+    try:
+        await client.generate(model=model, prompt="", keep_alive=keep_alive_for(model))
+        return True
+    except Exception as e:
+        print(f"Model preload failed for {model}: {e}")
+        return False
+
+
+_preloading = set()
+_preloading_lock = threading.Lock()
+
+
+def start_preload(client, host_url, model):
+    """
+    Avvia il preload in un thread di background, una sola volta per (host, modello)
+    finche' e' in corso. Returns False if one was already running.
+    """
+    key = (host_url, model)
+    with _preloading_lock:
+        if key in _preloading:
+            return False
+        _preloading.add(key)
+
+    def run():
+        try:
+            preload(client, model)
+        finally:
+            with _preloading_lock:
+                _preloading.discard(key)
+
+    threading.Thread(target=run, daemon=True).start()
+    return True
@@ -0,0 +1,251 @@
+import asyncio
+import contextlib
+import os
+import threading
+import time
+
+import httpx
+import ollama
+
+# === CONFIGURAZIONE ===
+# Max HTTP connections kept towards a single Ollama host (shared by all sessions)
+MAX_CONNECTIONS_PER_HOST = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "8"))
+# Seconds after which an unused host client is closed and dropped from the registry
+IDLE_EVICT_SECONDS = int(os.getenv("OLLAMA_IDLE_EVICT_SECONDS", "600"))
+# Seconds an idle keep-alive socket stays open inside the pool
+KEEPALIVE_EXPIRY = 60.0
+# Max chat streams running at the same time against one Ollama host (async pipeline)
+HOST_CONCURRENCY = int(os.getenv("OLLAMA_HOST_CONCURRENCY", "4"))
+
+
+class ConnectionStats:
+    """Contatori condivisi: connessioni TCP aperte vs riutilizzate."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.reused = 0
+        self.clients_created = 0
+        self.clients_reused = 0
+        self.clients_evicted = 0
+
+    def record_request(self, opened_new_connection):
+        with self._lock:
+            if opened_new_connection:
+                self.opened += 1
+            else:
+                self.reused += 1
+
+    def record_client(self, created):
+        with self._lock:
+            if created:
+                self.clients_created += 1
+            else:
+                self.clients_reused += 1
+
+    def record_eviction(self, count=1):
+        with self._lock:
+            self.clients_evicted += count
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "connections_opened": self.opened,
+                "connections_reused": self.reused,
+                "clients_created": self.clients_created,
+                "clients_reused": self.clients_reused,
+                "clients_evicted": self.clients_evicted,
+            }
+
+
+class _CountingTransport(httpx.HTTPTransport):
+    """Transport httpx che conta le connessioni TCP aperte vs riutilizzate."""
+
+    def __init__(self, stats, **kwargs):
+        super().__init__(**kwargs)
+        self._stats = stats
+
+    def handle_request(self, request):
+        opened = []
+
+        def trace(event_name, info):
+            if event_name == "connection.connect_tcp.complete":
+                opened.append(True)
+
+        request.extensions = {**request.extensions, "trace": trace}
+        response = super().handle_request(request)
+        self._stats.record_request(bool(opened))
+        return response
+
+
+class _CountingAsyncTransport(httpx.AsyncHTTPTransport):
+    """Async twin of `_CountingTransport`."""
+
+    def __init__(self, stats, **kwargs):
+        super().__init__(**kwargs)
+        self._stats = stats
+
+    async def handle_async_request(self, request):
+        opened = []
+
+        async def trace(event_name, info):
+            if event_name == "connection.connect_tcp.complete":
+                opened.append(True)
+
+        request.extensions = {**request.extensions, "trace": trace}
+        response = await super().handle_async_request(request)
+        self._stats.record_request(bool(opened))
+        return response
+
+
+class ClientRegistry:
+    """
+    Registro di client Ollama condivisi, uno per coppia (host, API key).
+    Gli host inutilizzati per `idle_evict_seconds` vengono chiusi.
+    """
+
+    def __init__(self, max_connections=MAX_CONNECTIONS_PER_HOST, idle_evict_seconds=IDLE_EVICT_SECONDS):
+        self.max_connections = max_connections
+        self.idle_evict_seconds = idle_evict_seconds
+        self.stats = ConnectionStats()
+        self._lock = threading.Lock()
+        self._clients = {}  # (host_url, api_key) -> [client, last_used]
+        # Async clients are bound to the event loop that created them
+        self._async_clients = {}  # (host_url, api_key, loop) -> [client, last_used]
+
+    def _limits(self):
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_connections,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        )
+
+    def _build_client(self, host_url, api_key, client_class=ollama.Client, transport_class=_CountingTransport):
+        transport = transport_class(self.stats, limits=self._limits())
+        if api_key:
+            return client_class(host=host_url, headers={"Authorization": f"Bearer {api_key}"}, transport=transport)
+        return client_class(host=host_url, transport=transport)
+
+    def _lookup(self, clients, key, factory):
+        with self._lock:
+            entry = clients.get(key)
+            if entry is not None:
+                entry[1] = time.monotonic()
+                self.stats.record_client(created=False)
+                return entry[0]
+            client = factory()
+            clients[key] = [client, time.monotonic()]
+            self.stats.record_client(created=True)
+            return client
+
+    def get(self, host_url, api_key=None):
+        """Restituisce il client condiviso per l'host, creandolo se necessario."""
+        host_url = host_url.rstrip("/")
+        self.evict_idle()
+        return self._lookup(self._clients, (host_url, api_key), lambda: self._build_client(host_url, api_key))
+
+    def get_async(self, host_url, api_key=None):
+        """Come `get`, ma restituisce un `ollama.AsyncClient` legato al loop corrente."""
+        host_url = host_url.rstrip("/")
+        loop = asyncio.get_running_loop()
+        self.evict_idle()
+        return self._lookup(
+            self._async_clients,
+            (host_url, api_key, loop),
+            lambda: self._build_client(host_url, api_key, ollama.AsyncClient, _CountingAsyncTransport),
+        )
+
+    def evict_idle(self):
+        now = time.monotonic()
+        evicted = []
+        with self._lock:
+            for clients in (self._clients, self._async_clients):
+                expired = [k for k, (_, last_used) in clients.items() if now - last_used > self.idle_evict_seconds]
+                evicted.extend((k, clients.pop(k)[0]) for k in expired)
+        for key, client in evicted:
+            _close_quietly(client, _loop_of(key))
+        if evicted:
+            self.stats.record_eviction(len(evicted))
+
+    def close_all(self):
+        with self._lock:
+            clients = [(k, entry[0]) for k, entry in self._clients.items()]
+            clients += [(k, entry[0]) for k, entry in self._async_clients.items()]
+            self._clients.clear()
+            self._async_clients.clear()
+        for key, client in clients:
+            _close_quietly(client, _loop_of(key))
+
+
+def _loop_of(key):
+    # Async client keys end with their event loop
+    return key[2] if len(key) == 3 else None
+
+
+# Closes scheduled on other loops, kept until they finish
+_pending_closes = set()
+
+
+def _close_quietly(client, loop=None):
+    try:
+        if loop is None:
+            client.close()
+        elif loop.is_running():
+            # The client's connections belong to its own loop, whichever thread we are on
+            future = asyncio.run_coroutine_threadsafe(client.close(), loop)
+            _pending_closes.add(future)
+            future.add_done_callback(_pending_closes.discard)
+        elif not loop.is_closed() and asyncio._get_running_loop() is None:
+            loop.run_until_complete(client.close())
+        # A closed loop already took its sockets with it; a stopped one is reused
+        # only when this thread is not inside another loop
+    except Exception as e:
+        print(f"Error closing Ollama client: {e}")
+
+
+class HostLimiter:
+    """Limita gli stream di chat contemporanei per host Ollama."""
+
+    def __init__(self, limit=HOST_CONCURRENCY):
+        self.limit = limit
+        self._semaphores = {}  # (host_url, loop) -> asyncio.Semaphore
+        self.waiting = {}
+        self.running = {}
+
+    @contextlib.asynccontextmanager
+    async def slot(self, host_url):
+        host_url = host_url.rstrip("/")
+        key = (host_url, asyncio.get_running_loop())
+        semaphore = self._semaphores.setdefault(key, asyncio.Semaphore(self.limit))
+        self.waiting[host_url] = self.waiting.get(host_url, 0) + 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.waiting[host_url] -= 1
+        self.running[host_url] = self.running.get(host_url, 0) + 1
+        try:
+            yield
+        finally:
+            self.running[host_url] -= 1
+            semaphore.release()
+
+
+# Process-wide registry shared by both frontends
+registry = ClientRegistry()
+host_limiter = HostLimiter()
+
+
+def get_client(host_url, api_key=None):
+    return registry.get(host_url, api_key)
+
+
+def get_async_client(host_url, api_key=None):
+    return registry.get_async(host_url, api_key)
+
+
+def host_slot(host_url):
+    return host_limiter.slot(host_url)
+
+
+def get_stats():
+    return registry.stats.snapshot()
@@ -1,264 +1,93 @@
 import gradio as gr
-import ollama
 import os
-import datetime
-import requests
-from bs4 import BeautifulSoup
-import time
+import asyncio
+
+from ollama_pool import get_async_client, get_stats
+from stream_buffer import StreamBuffer
+from context_window import context_manager
+from log_index import search_logs, format_results_markdown
+from host_pool import host_pool
+from model_warmup import keep_alive_for, preload_async
+from generation_control import generations
+from single_flight import single_flight
+from chat_engine import stream_chat, extract_text_from_content, SEARXNG_URL
+from page_fetch import DEEP_CONTEXT, DEEP_CONTEXT_TOP_K, DEEP_CONTEXT_BUDGET
+from metrics import registry as metrics_registry, format_footer, METRICS_FOOTER, CONTENT_TYPE as METRICS_CONTENT_TYPE
 
 # === CONFIGURAZIONE ===
 API_KEY = os.getenv("OLLAMA_API_KEY")
-SEARXNG_URL = "http://192.168.1.125:8989/search"
-
-# === FUNZIONI DI LOG ===
-def get_log_file():
-    today = datetime.date.today().strftime("%Y-%m-%d")
-    return f"chat_log_{today}.md"
-
-def log_message(role, content):
-    log_file = get_log_file()
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    with open(log_file, "a", encoding="utf-8") as f:
-        f.write(f"### {role} ({timestamp})\n")
-        f.write(content + "\n\n")
+# Gradio queue: chat turns processed concurrently and max requests waiting in line
+CHAT_CONCURRENCY = int(os.getenv("CHAT_CONCURRENCY", "32"))
+QUEUE_MAX_SIZE = int(os.getenv("QUEUE_MAX_SIZE", "128"))
+TIMINGS_TITLE = "⏱️ Tempi del turno"
 
 # === FUNZIONI UTILI ===
 def check_host_status(host_url):
-    try:
-        r = requests.get(f"{host_url}/api/tags", timeout=2)
-        return r.status_code == 200
-    except Exception:
-        return False
+    # Served from the background host monitor
+    return host_pool.is_healthy(host_url)
 
 def get_available_models(host_url):
-    try:
-        # Initialize client with dynamic host
-        if API_KEY:
-            client = ollama.Client(host=host_url, headers={"Authorization": f"Bearer {API_KEY}"})
-        else:
-            client = ollama.Client(host=host_url)
-            
-        response = client.list()
-        if hasattr(response, 'models'):
-            models = response.models
-        else:
-            models = response.get('models', [])
-            
-        model_names = []
-        for m in models:
-            if hasattr(m, 'model'):
-                model_names.append(m.model)
-            elif hasattr(m, 'name'):
-                model_names.append(m.name)
-            elif isinstance(m, dict):
-                model_names.append(m.get('model') or m.get('name'))
-            else:
-                model_names.append(str(m))
-        return model_names
-    except Exception as e:
-        print(f"Error listing models: {e}")
-        return []
+    # Served from the background host monitor, no request per call
+    return host_pool.models(host_url)
 
 
-def extract_text_from_content(content):
-    """
-    Extracts text from Gradio's multimodal content format.
-    Handles:
-    - Simple string
-    - List of dicts (Gradio 5.x/6.x multimodal)
-    """
-    if isinstance(content, str):
-        return content
-    if isinstance(content, list):
-        return " ".join([item["text"] for item in content if isinstance(item, dict) and item.get("type") == "text"])
-    return str(content)
-
-def search_searxng(query):
-    """
-    Esegue una ricerca su SearXNG.
-    Tenta prima l'API JSON. Se fallisce (es. 403), fa fallback sul parsing HTML.
-    """
-    # 1. Tentativo JSON
-    params = {
-        "q": query,
-        "format": "json",
-        "language": "it"
-    }
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-    }
-    
-    try:
-        # Try JSON first
-        response = requests.get(SEARXNG_URL, params=params, headers=headers, timeout=5)
-        if response.status_code == 200:
-            data = response.json()
-            return data.get("results", [])
-        elif response.status_code == 403:
-            pass
-        else:
-            print(f"SearXNG JSON error: {response.status_code}")
-            return []
-
-    except Exception as e:
-        print(f"SearXNG connection failed: {e}")
-        return []
-
-    # 2. Fallback HTML
-    try:
-        params.pop("format") # Rimuovi format=json
-        response = requests.get(SEARXNG_URL, params=params, headers=headers, timeout=5)
-        
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.text, 'html.parser')
-            results = []
-            
-            for article in soup.select("article.result"):
-                title_elem = article.select_one("h3 a, h4 a")
-                content_elem = article.select_one(".content, .result-content")
-                
-                if title_elem:
-                    title = title_elem.get_text(strip=True)
-                    url = title_elem.get("href")
-                    content = content_elem.get_text(strip=True) if content_elem else ""
-                    
-                    results.append({
-                        "title": title,
-                        "url": url,
-                        "content": content
-                    })
-            
-            return results
-        else:
-            print(f"SearXNG HTML error: {response.status_code}")
-            return []
-            
-    except Exception as e:
-        print(f"SearXNG HTML parsing failed: {e}")
-        return []
+# === UI EVENTS ===
+def host_status_text(models):
+    if not models:
+        return "🔴 Host non raggiungibile o nessun modello"
+    stats = get_stats()
+    return f"🟢 Host connesso\n\n*Connessioni Ollama: {stats['connections_opened']} aperte / {stats['connections_reused']} riutilizzate*"
 
-# === CHAT LOGIC ===
-def chat_function(message, history, model_name, use_web, host_url):
-    if not message:
-        return ""
-    
-    if not model_name:
-        yield "⚠️ Seleziona un modello per continuare."
-        return
+def update_models(host_url):
+    models = get_available_models(host_url)
+    if not models:
+        return gr.Dropdown(choices=[], value=None, interactive=True), host_status_text(models)
+    return gr.Dropdown(choices=models, value=models[0] if models else None, interactive=True), host_status_text(models)
 
-    # Log User
-    log_message("Utente", message)
-
-    # Initialize Client
-    try:
-        if API_KEY:
-            client = ollama.Client(host=host_url, headers={"Authorization": f"Bearer {API_KEY}"})
-        else:
-            client = ollama.Client(host=host_url)
-    except Exception as e:
-        yield f"⚠️ Errore connessione client: {e}"
-        return
+def refresh_models(host_url):
+    host_pool.refresh(host_url)
+    return update_models(host_url)
 
-    final_prompt = message
-    web_context_msg = ""
+def pool_panel_markdown():
+    joined = single_flight.stats["joined"]
+    return f"{host_pool.status_markdown()}\n\n{generations.summary_markdown()}\n\n*Richieste identiche accorpate: {joined}*"
 
-    # Web Search Logic
-    if use_web:
-        try:
-            search_query = message
-            
-            # Simple context extraction from history for short queries
-            # Gradio history is list of [user, bot] lists
-            if len(history) > 0 and len(message.strip()) < 50:
-                last_user_msg = history[-1][0]
-                import re
-                years = re.findall(r'\b(20\d{2})\b', last_user_msg)
-                if years and years[0] not in message:
-                    search_query = f"{message} {years[0]}"
-            
-            yield "🔎 Ricerca su SearXNG in corso..."
-            results = search_searxng(search_query)
-            
-            if results:
-                results = results[:3]
-                context_parts = []
-                MAX_CHARS_PER_RESULT = 1000
-                MAX_TOTAL_CHARS = 5000
-                total_chars = 0
-                
-                # Log Web Results
-                web_log_content = "\n".join([f"{r.get('title', 'No Title')} - {r.get('url', 'No URL')}" for r in results])
-                log_message("SearXNG Search", web_log_content)
-
-                for r in results:
-                    title = r.get("title", "No Title")
-                    url = r.get("url", "#")
-                    content = r.get("content", "")
-                    
-                    if content:
-                        truncated_content = content[:MAX_CHARS_PER_RESULT]
-                        if total_chars + len(truncated_content) > MAX_TOTAL_CHARS:
-                            remaining = MAX_TOTAL_CHARS - total_chars
-                            if remaining > 100:
-                                truncated_content = content[:remaining]
-                                context_parts.append(f"{title}: {truncated_content}...")
-                                total_chars += len(truncated_content)
-                            break
-                        else:
-                            context_parts.append(f"{title}: {truncated_content}...")
-                            total_chars += len(truncated_content)
-                
-                context = "\n\n".join(context_parts)
-                
-                if context:
-                    final_prompt = f"{message}\n\nContesto Web (da SearXNG):\n{context}\n\nRispondi in italiano in modo conciso basandoti sul contesto web fornito."
-                    web_context_msg = f"\n\n*Contesto web trovato: {len(results)} risultati*"
-                else:
-                    web_context_msg = "\n\n*Nessun contesto utile trovato*"
-            else:
-                web_context_msg = "\n\n*Nessun risultato dalla ricerca web*"
-                
-        except Exception as e:
-            print(f"Web search error: {e}")
-            web_context_msg = f"\n\n*Errore ricerca web: {e}*"
-
-    # Build messages payload for Ollama
-    # Convert Gradio history to Ollama format
-    messages_payload = []
-    for user_msg, bot_msg in history:
-        messages_payload.append({"role": "user", "content": user_msg})
-        messages_payload.append({"role": "assistant", "content": bot_msg})
-    
-    messages_payload.append({"role": "user", "content": final_prompt})
-
-    # Streaming Response
-    full_response = ""
-    try:
-        stream = client.chat(model=model_name, messages=messages_payload, stream=True)
-        
-        for chunk in stream:
-            content = None
-            if hasattr(chunk, "message") and hasattr(chunk.message, "content"):
-                content = chunk.message.content
-            elif isinstance(chunk, dict) and "message" in chunk and "content" in chunk["message"]:
-                content = chunk["message"]["content"]
-            
-            if content:
-                full_response += content
-                yield full_response
-        
-        # Log Assistant
-        log_message("Assistente", full_response)
-        
-    except Exception as e:
-        yield f"⚠️ Errore generazione: {e}"
-
-# === UI EVENTS ===
-def update_models(host_url):
-    models = get_available_models(host_url)
+def push_host_updates(host_url, model, seen_version):
+    """
+    Tick del timer: aggiorna pannello host, stato e lista modelli solo se il
+    monitor ha visto un cambiamento per l'host selezionato.
+    """
+    pool_markdown = pool_panel_markdown()
+    state = host_pool.state(host_url)
+    if state.version == seen_version:
+        return pool_markdown, gr.update(), gr.update(), seen_version
+    models = list(state.models)
     if not models:
-        return gr.Dropdown(choices=[], value=None, interactive=True), "🔴 Host non raggiungibile o nessun modello"
-    return gr.Dropdown(choices=models, value=models[0] if models else None, interactive=True), "🟢 Host connesso"
+        dropdown = gr.Dropdown(choices=[], value=None)
+    elif model in models:
+        # Keep the current selection (no spurious preload)
+        dropdown = gr.Dropdown(choices=models)
+    else:
+        dropdown = gr.Dropdown(choices=models, value=models[0])
+    return pool_markdown, dropdown, host_status_text(models), state.version
+
+async def on_model_selected(model, host_url):
+    """Preload del modello appena selezionato e indicatore di stato."""
+    if not model:
+        yield ""
+        return
+    yield f"⏳ Caricamento di **{model}** in corso..."
+    await preload_async(get_async_client(host_url, API_KEY), model)
+    # Re-check /api/ps now, the monitor would only notice on its next poll
+    state = await asyncio.to_thread(host_pool.refresh, host_url)
+    if model in state.running:
+        yield f"🟢 Modello in memoria (keep_alive: {keep_alive_for(model)})"
+    else:
+        yield "⚪ Modello non caricato"
+
+def search_chat_logs(query):
+    results, elapsed_ms = search_logs(query)
+    return format_results_markdown(results, elapsed_ms)
 
 # === CUSTOM CSS ===
 CUSTOM_CSS = """
@@ -306,6 +135,7 @@ with gr.Blocks(title="Assistente Ollama NG MEM", fill_height=True) as demo:
                     choices=[],
                     interactive=True
                 )
+                model_status = gr.Markdown("")
                 
                 refresh_btn = gr.Button("🔄 Aggiorna Modelli")
                 
@@ -315,6 +145,28 @@ with gr.Blocks(title="Assistente Ollama NG MEM", fill_height=True) as demo:
                     info=f"Server: {SEARXNG_URL}"
                 )
 
+                use_pool_checkbox = gr.Checkbox(
+                    label="Pool di host Ollama",
+                    value=False,
+                    info="Instrada verso l'host sano meno carico che ha il modello, con failover"
+                )
+                deep_context_checkbox = gr.Checkbox(
+                    label="Contesto approfondito",
+                    value=DEEP_CONTEXT,
+                    info=f"Scarica il testo delle prime {DEEP_CONTEXT_TOP_K} pagine (max {DEEP_CONTEXT_BUDGET:g} s) invece dei soli snippet"
+                )
+                show_timings_checkbox = gr.Checkbox(
+                    label="Mostra tempi del turno",
+                    value=METRICS_FOOTER,
+                    info="Debug: durata di gate, ricerca, prompt, TTFT e tok/s sotto ogni risposta"
+                )
+                pool_status = gr.Markdown(pool_panel_markdown())
+                pool_timer = gr.Timer(2.0)
+
+            with gr.Accordion("🔍 Cerca nei log", open=False):
+                log_query = gr.Textbox(show_label=False, placeholder="Cerca nelle conversazioni passate...")
+                log_results = gr.Markdown("")
+
         with gr.Column(scale=4):
             chatbot = gr.Chatbot(
                 elem_id="chatbot",
@@ -333,174 +185,138 @@ with gr.Blocks(title="Assistente Ollama NG MEM", fill_height=True) as demo:
             
             with gr.Row():
                 submit_btn = gr.Button("Invia", variant="primary")
+                stop_btn = gr.Button("⏹️ Stop", variant="stop")
                 clear_btn = gr.Button("Cancella Conversazione")
 
     # Event Handlers
     
     # Load models on start and on refresh
     demo.load(update_models, inputs=[host_input], outputs=[model_dropdown, status_output])
-    refresh_btn.click(update_models, inputs=[host_input], outputs=[model_dropdown, status_output])
+    refresh_btn.click(refresh_models, inputs=[host_input], outputs=[model_dropdown, status_output])
     host_input.change(update_models, inputs=[host_input], outputs=[model_dropdown, status_output])
 
+    # Preload the selected model so the first answer does not pay the load time
+    model_dropdown.change(on_model_selected, inputs=[model_dropdown, host_input], outputs=[model_status])
+
+    # Push host monitor changes (health, models) to the UI
+    host_version = gr.State(-1)
+    pool_timer.tick(
+        push_host_updates, [host_input, model_dropdown, host_version],
+        [pool_status, model_dropdown, status_output, host_version], queue=False
+    )
+    # A new host has its own version counter: push its first check whatever the old one saw
+    host_input.change(lambda: -1, None, host_version, queue=False)
+
+    log_query.submit(search_chat_logs, inputs=[log_query], outputs=[log_results])
+
     # Chat interaction
     # Note: gr.ChatInterface is simpler but we want custom layout, so we use submit/click
     
     def user(user_message, history):
         return "", history + [{"role": "user", "content": user_message}]
 
-    def bot(history, model, use_web, host):
-        # Extract user message content
-        raw_content = history[-1]["content"]
-        user_message = extract_text_from_content(raw_content)
-        
+    async def bot(history, model, use_web, host, use_pool=False, show_timings=False, deep_context=False,
+                  request: gr.Request = None):
+        session_id = request.session_hash if request else "default"
+        # Long-term memory needs a logged-in user (launch with auth=...)
+        owner = request.username if request else None
+        user_message = extract_text_from_content(history[-1]["content"])
+        # Timing footers are UI-only messages: keep them out of the prompt
+        previous = [m for m in history[:-1] if (m.get("metadata") or {}).get("title") != TIMINGS_TITLE]
+
         if not model:
             history.append({"role": "assistant", "content": "⚠️ Seleziona un modello per continuare."})
             yield history
             return
 
-        # Log User
-        log_message("Utente", user_message)
-
-        # Initialize Client
-        try:
-            if API_KEY:
-                client = ollama.Client(host=host, headers={"Authorization": f"Bearer {API_KEY}"})
-            else:
-                client = ollama.Client(host=host)
-        except Exception as e:
-            history.append({"role": "assistant", "content": f"⚠️ Errore connessione client: {e}"})
-            yield history
-            return
-
-        final_prompt = user_message
-        
-        # Web Search Logic
-        if use_web:
-            try:
-                search_query = user_message
-                # Simple context extraction
-                if len(history) > 2 and len(user_message.strip()) < 50:
-                    # Sanitize previous user message before regex
-                    last_user_msg = extract_text_from_content(history[-3]["content"]) 
-                    import re
-                    years = re.findall(r'\b(20\d{2})\b', last_user_msg)
-                    if years and years[0] not in user_message:
-                        search_query = f"{user_message} {years[0]}"
-                
-                # Notify searching...
+        # Chunks are coalesced: the UI gets at most STREAM_UPDATES_PER_SECOND updates
+        buffer = StreamBuffer()
+        async for event in stream_chat(user_message, previous, model, host, use_web, use_pool, session_id,
+                                           deep_context=deep_context, owner=owner):
+            kind = event["type"]
+            if kind == "searching":
                 history.append({"role": "assistant", "content": "🔎 Ricerca su SearXNG in corso..."})
                 yield history
-                
-                results = search_searxng(search_query)
-                
-                # Remove the "Searching..." message
+            elif kind == "search":
                 history.pop()
-                
-                if results:
-                    results = results[:3]
-                    context_parts = []
-                    MAX_CHARS_PER_RESULT = 1000
-                    MAX_TOTAL_CHARS = 5000
-                    total_chars = 0
-                    
-                    # Log Web Results
-                    web_log_content = "\n".join([f"{r.get('title', 'No Title')} - {r.get('url', 'No URL')}" for r in results])
-                    log_message("SearXNG Search", web_log_content)
-
-                    for r in results:
-                        title = r.get("title", "No Title")
-                        url = r.get("url", "#")
-                        content = r.get("content", "")
-                        
-                        if content:
-                            truncated_content = content[:MAX_CHARS_PER_RESULT]
-                            if total_chars + len(truncated_content) > MAX_TOTAL_CHARS:
-                                remaining = MAX_TOTAL_CHARS - total_chars
-                                if remaining > 100:
-                                    truncated_content = content[:remaining]
-                                    context_parts.append(f"{title}: {truncated_content}...")
-                                    total_chars += len(truncated_content)
-                                break
-                            else:
-                                context_parts.append(f"{title}: {truncated_content}...")
-                                total_chars += len(truncated_content)
-                    
-                    context = "\n\n".join(context_parts)
-                    
-                    if context:
-                        final_prompt = f"{user_message}\n\nContesto Web (da SearXNG):\n{context}\n\nRispondi in italiano in modo conciso basandoti sul contesto web fornito."
-            except Exception as e:
-                print(f"Web search error: {e}")
-
-        # Build messages payload for Ollama
-        # history contains [{"role": "user", "content": "..."}] (current message is last)
-        # We need to pass everything EXCEPT the last one as history, and the last one (modified) as prompt
-        # CRITICAL: Sanitize ALL history messages to ensure they are strings, not lists, 
-        # otherwise Ollama client (Pydantic) will fail on 2nd turn.
-        
-        messages_payload = []
-        # Inject System Prompt with Date
-        try:
-            # Try to set locale to Italian for correct day/month names, fallback to default if fails
-            import locale
-            try:
-                locale.setlocale(locale.LC_TIME, "it_IT.utf8") 
-            except:
-                try:
-                    locale.setlocale(locale.LC_TIME, "it_IT")
-                except:
-                    pass # Keep default
-        except:
-            pass
-
-        today_date = datetime.date.today().strftime("%A %d %B %Y")
-        system_instructions = f"Oggi è {today_date}. Sei un assistente utile e preciso. Rispondi sempre in italiano."
-        messages_payload.append({"role": "system", "content": system_instructions})
-        for msg in history:
-             # msg is a dict, we need to copy and clean the content
-             cleaned_msg = msg.copy()
-             cleaned_msg["content"] = extract_text_from_content(msg["content"])
-             messages_payload.append(cleaned_msg)
-
-        # Replace the last message content with our finalized prompt (with context if any)
-        messages_payload[-1]["content"] = final_prompt
-
-        # Streaming Response
-        history.append({"role": "assistant", "content": ""})
-        full_response = ""
-        
-        try:
-            stream = client.chat(model=model, messages=messages_payload, stream=True)
-            
-            for chunk in stream:
-                content = None
-                if hasattr(chunk, "message") and hasattr(chunk.message, "content"):
-                    content = chunk.message.content
-                elif isinstance(chunk, dict) and "message" in chunk and "content" in chunk["message"]:
-                    content = chunk["message"]["content"]
-                
-                if content:
-                    full_response += content
-                    history[-1]["content"] = full_response
+                history.append({"role": "assistant", "content": ""})
+            elif kind == "delta":
+                if history[-1]["role"] != "assistant":
+                    history.append({"role": "assistant", "content": ""})
+                if buffer.add(event["content"]):
+                    history[-1]["content"] = buffer.flush()
                     yield history
-            
-            # Log Assistant
-            log_message("Assistente", full_response)
-            
-        except Exception as e:
-            history[-1]["content"] = f"⚠️ Errore generazione: {e}"
-            yield history
+            elif kind == "done":
+                if history[-1]["role"] != "assistant":
+                    history.append({"role": "assistant", "content": ""})
+                history[-1]["content"] = event["content"]
+                if show_timings:
+                    history.append({"role": "assistant", "content": format_footer(event["timings"]),
+                                    "metadata": {"title": TIMINGS_TITLE}})
+                yield history
+            elif kind == "cancelled":
+                # After clear/resubmit/disconnect the chat shows something else: leave it alone
+                if event["reason"] == "stop":
+                    if history[-1]["role"] != "assistant":
+                        history.append({"role": "assistant", "content": ""})
+                    history[-1]["content"] = (event["content"] + "\n\n*⏹️ Generazione interrotta*").lstrip()
+                    yield history
+            elif kind == "error":
+                if history[-1]["role"] != "assistant":
+                    history.append({"role": "assistant", "content": ""})
+                history[-1]["content"] = f"⚠️ Errore generazione: {event['message']}"
+                yield history
 
     # Submit handler
+    # All chat turns share one concurrency group; per-host limits are in ollama_pool
     msg.submit(user, [msg, chatbot], [msg, chatbot], queue=False).then(
-        bot, [chatbot, model_dropdown, use_web_checkbox, host_input], chatbot
+        bot, [chatbot, model_dropdown, use_web_checkbox, host_input, use_pool_checkbox, show_timings_checkbox,
+         deep_context_checkbox], chatbot,
+        concurrency_limit=CHAT_CONCURRENCY, concurrency_id="chat"
     )
     
     submit_btn.click(user, [msg, chatbot], [msg, chatbot], queue=False).then(
-        bot, [chatbot, model_dropdown, use_web_checkbox, host_input], chatbot
+        bot, [chatbot, model_dropdown, use_web_checkbox, host_input, use_pool_checkbox, show_timings_checkbox,
+         deep_context_checkbox], chatbot,
+        concurrency_limit=CHAT_CONCURRENCY, concurrency_id="chat"
     )
     
-    clear_btn.click(lambda: [], None, chatbot, queue=False)
+    def stop_generation(request: gr.Request):
+        generations.cancel(request.session_hash, "stop")
+
+    stop_btn.click(stop_generation, None, None, queue=False)
+
+    def clear_conversation(request: gr.Request):
+        generations.cancel(request.session_hash, "clear")
+        context_manager.reset(request.session_hash)
+        return []
+
+    clear_btn.click(clear_conversation, None, chatbot, queue=False)
+
+    # Closed or reloaded tab: stop generating for nobody
+    def on_disconnect(request: gr.Request):
+        generations.cancel(request.session_hash, "disconnessione")
+
+    demo.unload(on_disconnect)
+
+host_pool.start()
+demo.queue(max_size=QUEUE_MAX_SIZE, default_concurrency_limit=CHAT_CONCURRENCY)
 
 if __name__ == "__main__":
-    demo.launch()
+    # Gradio mounted on a FastAPI app, so Prometheus can scrape /metrics on the same port
+    import uvicorn
+    from fastapi import FastAPI
+    from fastapi.responses import PlainTextResponse
+
+    app = FastAPI()
+
+    @app.get("/metrics")
+    def metrics():
+        return PlainTextResponse(metrics_registry.render(), media_type=METRICS_CONTENT_TYPE)
+
+    app = gr.mount_gradio_app(app, demo, path="/")
+    uvicorn.run(
+        app,
+        host=os.getenv("GRADIO_SERVER_NAME", "127.0.0.1"),
+        port=int(os.getenv("GRADIO_SERVER_PORT", "7860")),
+    )
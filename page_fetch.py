@@ -0,0 +1,240 @@
+"""
+Contesto approfondito: testo principale delle pagine dei risultati SearXNG.
+Download in parallelo entro un budget di tempo; chi non arriva in tempo tiene lo snippet.
+"""
+import codecs
+import concurrent.futures
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from html.parser import HTMLParser
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from searxng import USER_AGENT
+
+# === CONFIGURAZIONE ===
+# Default of the "deep context" toggle in the UIs and chat_server.py
+DEEP_CONTEXT = os.getenv("DEEP_CONTEXT", "0") == "1"
+DEEP_CONTEXT_TOP_K = int(os.getenv("DEEP_CONTEXT_TOP_K", "3"))
+DEEP_CONTEXT_BUDGET = float(os.getenv("DEEP_CONTEXT_BUDGET", "2.5"))  # seconds, for all pages together
+DEEP_CONTEXT_MAX_CHARS = int(os.getenv("DEEP_CONTEXT_MAX_CHARS", "3000"))  # per page
+PAGE_CACHE_TTL = int(os.getenv("PAGE_CACHE_TTL", "3600"))  # seconds before revalidating
+PAGE_CACHE_SIZE = int(os.getenv("PAGE_CACHE_SIZE", "256"))
+MAX_PAGE_BYTES = 2 * 1024 * 1024
+CHUNK_BYTES = 16 * 1024
+MIN_BLOCK_CHARS = 40  # shorter blocks are menus, buttons, captions
+
+session = requests.Session()
+session.headers.update({"User-Agent": USER_AGENT, "Accept": "text/html,application/xhtml+xml,text/plain;q=0.8"})
+session.mount("http://", HTTPAdapter(pool_connections=16, pool_maxsize=16))
+session.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=16))
+
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=8, thread_name_prefix="page-fetch")
+
+# Subtrees that are never main text
+_SKIP_TAGS = {"script", "style", "noscript", "template", "svg", "nav", "header", "footer", "aside", "form",
+              "button", "select", "iframe"}
+# Elements whose text forms one block
+_BLOCK_TAGS = {"p", "li", "h1", "h2", "h3", "h4", "h5", "h6", "blockquote", "pre", "dd", "td", "figcaption"}
+_VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+_CHARSET = re.compile(r"charset=[\"']?([\w.:-]+)", re.IGNORECASE)
+
+
+class _MainTextExtractor(HTMLParser):
+    """
+    Testo dei blocchi (paragrafi, voci di lista, titoli) fuori da menu e script.
+    `full` diventa True dopo `max_chars` caratteri.
+    """
+
+    def __init__(self, max_chars):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.blocks = []
+        self.chars = 0
+        self._skip_depth = 0
+        self._block_depth = 0
+        self._parts = []
+
+    @property
+    def full(self):
+        return self.chars >= self.max_chars
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _VOID_TAGS:
+            return
+        if self._skip_depth or tag in _SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in _BLOCK_TAGS:
+            if self._block_depth == 0:
+                self._parts = []
+            self._block_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in _VOID_TAGS:
+            return
+        if self._skip_depth:
+            self._skip_depth -= 1
+        elif tag in _BLOCK_TAGS and self._block_depth:
+            self._block_depth -= 1
+            if self._block_depth == 0:
+                self._finish_block()
+
+    def handle_data(self, data):
+        if self._block_depth and not self._skip_depth:
+            self._parts.append(data)
+
+    def _finish_block(self):
+        text = " ".join("".join(self._parts).split())
+        if len(text) >= MIN_BLOCK_CHARS and not self.full:
+            self.blocks.append(text)
+            self.chars += len(text) + 1
+
+    def text(self):
+        return "\n".join(self.blocks)[:self.max_chars]
+
+
+def _decoder(response):
+    match = _CHARSET.search(response.headers.get("Content-Type", ""))
+    try:
+        return codecs.getincrementaldecoder(match.group(1) if match else "utf-8")(errors="replace")
+    except LookupError:
+        return codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+
+def extract_stream(response, max_chars, deadline):
+    """
+    Testo principale dalla risposta letta a pezzi. Returns None when the
+    deadline passes first (a partial page is not worth more than the snippet).
+    """
+    content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+    decoder = _decoder(response)
+    if content_type == "text/plain":
+        text, size = [], 0
+        for chunk in response.iter_content(CHUNK_BYTES):
+            if time.monotonic() > deadline:
+                return None
+            text.append(decoder.decode(chunk))
+            size += len(chunk)
+            if sum(map(len, text)) >= max_chars or size >= MAX_PAGE_BYTES:
+                break
+        return " ".join("".join(text).split())[:max_chars]
+    if content_type not in ("text/html", "application/xhtml+xml"):
+        return None  # PDFs, images...: keep the snippet
+
+    extractor = _MainTextExtractor(max_chars)
+    size = 0
+    for chunk in response.iter_content(CHUNK_BYTES):
+        if time.monotonic() > deadline:
+            return None
+        extractor.feed(decoder.decode(chunk))
+        size += len(chunk)
+        if extractor.full or size >= MAX_PAGE_BYTES:
+            break
+    else:
+        extractor.feed(decoder.decode(b"", final=True))
+        extractor.close()
+    return extractor.text()
+
+
+class PageCache:
+    """
+    Cache LRU del testo estratto per URL.
+    Scaduta la TTL, rivalida con ETag / Last-Modified (304 = nessun download).
+    """
+
+    def __init__(self, ttl=PAGE_CACHE_TTL, max_entries=PAGE_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # url -> {"text", "etag", "last_modified", "checked_at"}
+        self._stats = {"hits": 0, "revalidated": 0, "misses": 0, "failed": 0, "timeouts": 0}
+
+    def get(self, url, deadline, max_chars=DEEP_CONTEXT_MAX_CHARS):
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries.move_to_end(url)
+                if time.time() - entry["checked_at"] <= self.ttl:
+                    self._stats["hits"] += 1
+                    return entry["text"]
+
+        headers = {}
+        if entry is not None:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+        timeout = max(0.1, deadline - time.monotonic())
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+                if response.status_code == 304 and entry is not None:
+                    with self._lock:
+                        entry["checked_at"] = time.time()
+                        self._stats["revalidated"] += 1
+                    return entry["text"]
+                if response.status_code != 200:
+                    self._count("failed")
+                    return None
+                text = extract_stream(response, max_chars, deadline)
+                etag = response.headers.get("ETag")
+                last_modified = response.headers.get("Last-Modified")
+        except requests.Timeout:
+            self._count("timeouts")
+            return None
+        except Exception as e:
+            print(f"Page fetch failed for {url}: {e}")
+            self._count("failed")
+            return None
+        if text is None:
+            self._count("timeouts" if time.monotonic() > deadline else "failed")
+            return None
+
+        with self._lock:
+            self._stats["misses"] += 1
+            self._entries[url] = {"text": text, "etag": etag, "last_modified": last_modified,
+                                  "checked_at": time.time()}
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return text
+
+    def _count(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "size": len(self._entries)}
+
+
+page_cache = PageCache()
+
+
+def enrich_results(results, top_k=DEEP_CONTEXT_TOP_K, budget=DEEP_CONTEXT_BUDGET, max_chars=DEEP_CONTEXT_MAX_CHARS):
+    """
+    Copie dei risultati con "content" sostituito dal testo della pagina
+    (e "snippet" con il testo originale) per i primi `top_k` scaricati entro
+    `budget` secondi; gli altri restano come sono.
+    """
+    deadline = time.monotonic() + budget
+    futures = {
+        _executor.submit(page_cache.get, r["url"], deadline, max_chars): i
+        for i, r in enumerate(results[:top_k]) if r.get("url", "").startswith(("http://", "https://"))
+    }
+    done, _ = concurrent.futures.wait(futures, timeout=budget)
+    enriched = [dict(r) for r in results]
+    for future in done:
+        text = future.result()
+        result = enriched[futures[future]]
+        if text and len(text) > len(result.get("content", "")):
+            result["snippet"] = result.get("content", "")
+            result["content"] = text
+    return enriched
@@ -0,0 +1,86 @@
+import datetime
+import threading
+
+from metrics import registry as metrics_registry
+
+# Italian names, so the date never depends on the process locale
+GIORNI = ["lunedì", "martedì", "mercoledì", "giovedì", "venerdì", "sabato", "domenica"]
+MESI = [
+    "gennaio", "febbraio", "marzo", "aprile", "maggio", "giugno",
+    "luglio", "agosto", "settembre", "ottobre", "novembre", "dicembre",
+]
+
+SYSTEM_INSTRUCTIONS = "Sei un assistente utile e preciso. Rispondi sempre in italiano."
+WEB_CONTEXT_INSTRUCTIONS = "Rispondi in italiano in modo conciso basandoti sul contesto web fornito."
+
+
+def format_italian_date(day):
+    return f"{GIORNI[day.weekday()]} {day.day:02d} {MESI[day.month - 1]} {day.year}"
+
+
+def system_message(today=None):
+    """
+    Prompt di sistema: identico per tutti i turni della giornata, cosi' Ollama
+    puo' riusare la KV cache del prefisso.
+    """
+    today = today or datetime.date.today()
+    return {"role": "system", "content": f"{SYSTEM_INSTRUCTIONS} Oggi è {format_italian_date(today)}."}
+
+
+def user_turn(message, context=""):
+    """
+    Ultimo messaggio utente: prima la domanda, poi il contesto web, cosi' il
+    prefisso in cache in Ollama resta valido fino alla fine della domanda.
+    """
+    if not context:
+        return message
+    return f"{message}\n\nContesto Web (da SearXNG):\n{context}\n\n{WEB_CONTEXT_INSTRUCTIONS}"
+
+
+def build_messages(history, extract_text):
+    """System prompt + storia con contenuti ridotti a testo (l'ultimo e' il messaggio corrente)."""
+    messages = [system_message()]
+    for msg in history:
+        messages.append({"role": msg["role"], "content": extract_text(msg["content"])})
+    return messages
+
+
+class PromptEvalStats:
+    """
+    Token di prompt valutati da Ollama per turno (`prompt_eval_count`):
+    se la KV cache viene riusata restano stabili tra un turno e l'altro.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.turns = 0
+        self.total_prompt_eval = 0
+        self.total_prompt_seconds = 0.0
+
+    def record(self, model, prompt_eval_count, prompt_eval_duration_ns=0):
+        if prompt_eval_count is None:
+            return
+        seconds = (prompt_eval_duration_ns or 0) / 1e9
+        with self._lock:
+            self.turns += 1
+            self.total_prompt_eval += prompt_eval_count
+            self.total_prompt_seconds += seconds
+
+    def snapshot(self):
+        with self._lock:
+            turns = self.turns or 1
+            return {
+                "turns": self.turns,
+                "avg_prompt_eval_count": self.total_prompt_eval / turns,
+                "avg_prompt_eval_seconds": self.total_prompt_seconds / turns,
+            }
+
+
+prompt_stats = PromptEvalStats()
+
+metrics_registry.gauge("ollweb_prompt_eval_turns_total", "Turni con prompt_eval_count registrato",
+                       lambda: prompt_stats.snapshot()["turns"], metric_type="counter")
+metrics_registry.gauge("ollweb_prompt_eval_tokens_avg", "Media di prompt_eval_count per turno",
+                       lambda: prompt_stats.snapshot()["avg_prompt_eval_count"])
+metrics_registry.gauge("ollweb_prompt_eval_seconds_avg", "Media dei secondi di prompt eval per turno",
+                       lambda: prompt_stats.snapshot()["avg_prompt_eval_seconds"])
@@ -0,0 +1,141 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from search_cache import normalize_query
+
+# === CONFIGURAZIONE ===
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE", "0") == "1"
+# Also match near-duplicate prompts through embeddings (uses memory_store's embedding model)
+RESPONSE_CACHE_SEMANTIC = os.getenv("RESPONSE_CACHE_SEMANTIC", "0") == "1"
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95"))
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "86400"))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "512"))
+# Answers built on web context are only reused while the context is fresh
+WEB_FRESHNESS_SECONDS = int(os.getenv("RESPONSE_CACHE_WEB_FRESHNESS", "900"))
+# How many previous messages take part in the key
+HISTORY_WINDOW = 4
+REPLAY_DELAY = 0.005  # seconds between replayed chunks
+
+
+def _digest(value):
+    return hashlib.sha256(json.dumps(value, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def context_key(model, system_prompt, history, use_web):
+    """Chiave del contesto: modello, system prompt normalizzato, ultimi messaggi e ricerca web si/no."""
+    recent = [(m["role"], normalize_query(m["content"])) for m in history[-HISTORY_WINDOW:]]
+    return _digest([model, normalize_query(system_prompt), recent, bool(use_web)])
+
+
+class _Entry:
+    __slots__ = ("answer", "stored_at", "web_dependent", "context", "vector")
+
+    def __init__(self, answer, web_dependent, context, vector):
+        self.answer = answer
+        self.stored_at = time.time()
+        self.web_dependent = web_dependent
+        self.context = context
+        self.vector = vector
+
+
+class ResponseCache:
+    """
+    Cache delle risposte per prompt ripetuti, esatta e (opzionale) semantica.
+    Le risposte con contesto web scadono dopo WEB_FRESHNESS_SECONDS.
+    """
+
+    def __init__(self, ttl=RESPONSE_CACHE_TTL, max_entries=RESPONSE_CACHE_SIZE,
+                 semantic=RESPONSE_CACHE_SEMANTIC, threshold=RESPONSE_CACHE_THRESHOLD):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.semantic = semantic
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> _Entry
+        self.stats = {"hits": 0, "semantic_hits": 0, "misses": 0, "expired": 0, "evictions": 0}
+
+    def _fresh(self, entry, now):
+        max_age = min(self.ttl, WEB_FRESHNESS_SECONDS) if entry.web_dependent else self.ttl
+        return now - entry.stored_at <= max_age
+
+    def lookup(self, model, system_prompt, history, prompt, use_web, embed=None):
+        """
+        Risposta in cache o None. `use_web`: la decisione del gate per questo turno.
+        `embed(text)` restituisce un vettore normalizzato (solo in modalita' semantica).
+        """
+        context = context_key(model, system_prompt, history, use_web)
+        key = _digest([context, normalize_query(prompt)])
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if self._fresh(entry, now):
+                    self._entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return entry.answer
+                del self._entries[key]
+                self.stats["expired"] += 1
+            candidates = [(k, e) for k, e in self._entries.items()
+                          if e.context == context and e.vector is not None and self._fresh(e, now)]
+
+        if self.semantic and embed is not None and candidates:
+            try:
+                query_vector = embed(prompt)
+            except Exception as e:
+                print(f"Response cache embedding failed: {e}")
+                query_vector = None
+            if query_vector is not None:
+                scores = np.vstack([e.vector for _, e in candidates]) @ query_vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    with self._lock:
+                        self.stats["semantic_hits"] += 1
+                        if candidates[best][0] in self._entries:
+                            self._entries.move_to_end(candidates[best][0])
+                    return candidates[best][1].answer
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def store(self, model, system_prompt, history, prompt, answer, use_web, embed=None):
+        """`use_web`: il turno voleva la ricerca; la risposta scade come contenuto web."""
+        if not answer:
+            return
+        context = context_key(model, system_prompt, history, use_web)
+        key = _digest([context, normalize_query(prompt)])
+        vector = None
+        if self.semantic and embed is not None:
+            try:
+                vector = embed(prompt)
+            except Exception as e:
+                print(f"Response cache embedding failed: {e}")
+        with self._lock:
+            self._entries[key] = _Entry(answer, bool(use_web), context, vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+
+def _replay_pieces(answer):
+    # Word-sized pieces, whitespace included, like the chunks Ollama streams
+    return re.findall(r"\S+\s*|\s+", answer)
+
+
+async def replay_stream_async(answer):
+    """Risposta in cache come stream di chunk, per il normale loop di streaming."""
+    for piece in _replay_pieces(answer):
+        yield {"message": {"role": "assistant", "content": piece}}
+        await asyncio.sleep(REPLAY_DELAY)
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,143 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import registry as metrics_registry
+
+# === CONFIGURAZIONE ===
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", "900"))  # seconds
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "256"))  # entries kept in memory
+# Optional SQLite file, e.g. "search_cache.sqlite3", so the cache survives restarts
+SEARCH_CACHE_DB = os.getenv("SEARCH_CACHE_DB")
+
+
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+
+class _InFlight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.results = []
+
+
+class SearchCache:
+    """
+    Cache dei risultati SearXNG con TTL ed eviction LRU.
+    Ricerche identiche concorrenti condividono una sola richiesta.
+    """
+
+    def __init__(self, ttl=SEARCH_CACHE_TTL, max_entries=SEARCH_CACHE_SIZE, db_path=SEARCH_CACHE_DB):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (stored_at, results)
+        self._in_flight = {}  # key -> _InFlight
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0, "coalesced": 0, "disk_hits": 0}
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS search_cache (key TEXT PRIMARY KEY, stored_at REAL, results TEXT)"
+            )
+            self._db.execute("DELETE FROM search_cache WHERE stored_at < ?", (time.time() - self.ttl,))
+            self._db.commit()
+
+    def get_or_fetch(self, query, language, fetch):
+        """Restituisce i risultati in cache oppure chiama `fetch(query)` una sola volta."""
+        key = f"{language}:{normalize_query(query)}"
+        with self._lock:
+            results = self._get_locked(key)
+            if results is not None:
+                self._stats["hits"] += 1
+                return results
+            flight = self._in_flight.get(key)
+            if flight is None:
+                flight = self._in_flight[key] = _InFlight()
+                owner = True
+                self._stats["misses"] += 1
+            else:
+                owner = False
+                self._stats["coalesced"] += 1
+
+        if not owner:
+            flight.done.wait()
+            return flight.results
+
+        try:
+            flight.results = fetch(query)
+            if flight.results:
+                self.put(key, flight.results)
+            return flight.results
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            flight.done.set()
+
+    def _get_locked(self, key):
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            stored_at, results = entry
+            if now - stored_at <= self.ttl:
+                self._entries.move_to_end(key)
+                return results
+            del self._entries[key]
+            self._stats["expired"] += 1
+
+        if self._db is not None:
+            row = self._db.execute("SELECT stored_at, results FROM search_cache WHERE key = ?", (key,)).fetchone()
+            if row and now - row[0] <= self.ttl:
+                results = json.loads(row[1])
+                self._store_locked(key, row[0], results)
+                self._stats["disk_hits"] += 1
+                return results
+        return None
+
+    def _store_locked(self, key, stored_at, results):
+        self._entries[key] = (stored_at, results)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def put(self, key, results):
+        stored_at = time.time()
+        with self._lock:
+            self._store_locked(key, stored_at, results)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO search_cache (key, stored_at, results) VALUES (?, ?, ?)",
+                    (key, stored_at, json.dumps(results, ensure_ascii=False)),
+                )
+                self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM search_cache")
+                self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "size": len(self._entries)}
+
+
+# Process-wide cache shared by both frontends
+cache = SearchCache()
+
+metrics_registry.gauge(
+    "ollweb_search_cache_lookups_total", "Ricerche per esito nella cache (disk_hits sono anche hits)",
+    lambda: {k: v for k, v in cache.stats().items() if k in ("hits", "misses", "coalesced", "disk_hits")},
+    label="result", metric_type="counter",
+)
+metrics_registry.gauge("ollweb_search_cache_evictions_total", "Voci rimosse dalla cache in memoria perche' piena",
+                       lambda: cache.stats()["evictions"], metric_type="counter")
+metrics_registry.gauge("ollweb_search_cache_expired_total", "Voci scadute (TTL) trovate in memoria",
+                       lambda: cache.stats()["expired"], metric_type="counter")
+metrics_registry.gauge("ollweb_search_cache_entries", "Voci nella cache in memoria",
+                       lambda: cache.stats()["size"])
@@ -0,0 +1,140 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from search_cache import normalize_query
+
+# === CONFIGURAZIONE ===
+# Optional small Ollama model asked when the heuristics are undecided (e.g. "qwen2.5:0.5b")
+SEARCH_GATE_MODEL = os.getenv("SEARCH_GATE_MODEL")
+GATE_CACHE_SIZE = 1024
+
+GREETINGS = {
+    "ciao", "salve", "buongiorno", "buonasera", "buonanotte", "hey", "ehi", "hello", "hi",
+    "grazie", "grazie mille", "ok", "okay", "va bene", "perfetto", "bene", "si", "sì", "no",
+    "come stai", "come va", "tutto bene", "arrivederci", "a presto", "ciao ciao",
+    "capito", "ottimo", "certo", "esatto", "d'accordo", "grazie tante", "thanks", "thank you",
+}
+# Words that ask for fresh or factual information
+FRESH_HINTS = re.compile(
+    r"\b(oggi|ieri|domani|adesso|ora|attual\w*|ultim\w+|recent\w*|notizi\w+|news|prezz\w+|cost[aio]|"
+    r"meteo|risultat\w+|classifica|quando|dove|chi|quant\w+|orari\w*|uscit\w+|elezion\w+|"
+    r"(?:19|20)\d{2})\b",
+    re.IGNORECASE,
+)
+# Requests the model can serve from the conversation alone
+SELF_CONTAINED_HINTS = re.compile(
+    r"\b(traduci|riassumi|riscrivi|correggi|spiega meglio|scrivi|calcola|codice|funzione|script)\b",
+    re.IGNORECASE,
+)
+
+CLASSIFIER_PROMPT = (
+    "Devi decidere se per rispondere alla domanda dell'utente serve una ricerca web "
+    "con informazioni aggiornate. Rispondi solo con SI oppure NO.\n\nDomanda: {query}"
+)
+
+
+def heuristic_decision(query):
+    """
+    Decisione rapida e locale: (True/False, motivo), oppure (None, motivo)
+    quando le euristiche non bastano.
+    """
+    normalized = normalize_query(query).strip(" !?.,;:")
+    if not normalized:
+        return False, "messaggio vuoto"
+    # Only greetings and acknowledgements are skipped locally: a short message
+    # such as a bare name ("Giorgia Meloni") is often exactly a web query
+    if normalized in GREETINGS:
+        return False, "saluto"
+    if "http://" in normalized or "https://" in normalized:
+        return True, "contiene un URL"
+    if FRESH_HINTS.search(normalized):
+        return True, "richiede informazioni aggiornate"
+    if SELF_CONTAINED_HINTS.search(normalized):
+        return False, "richiesta autonoma"
+    return None, "incerto"
+
+
+class SearchGate:
+    """
+    Decide se un messaggio ha bisogno del contesto web prima di chiamare SearXNG.
+    Euristiche locali, poi un classificatore opzionale con cache.
+    """
+
+    def __init__(self, classifier_model=SEARCH_GATE_MODEL, cache_size=GATE_CACHE_SIZE):
+        self.classifier_model = classifier_model
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._decisions = OrderedDict()  # normalized query -> (needs_search, reason)
+        # Moving average of real search latency, used to estimate the time saved
+        self.avg_search_seconds = 0.0
+        self.skipped = 0
+        self.searched = 0
+
+    def decide(self, query, client=None):
+        """Restituisce (needs_search, motivo)."""
+        needs_search, reason = heuristic_decision(query)
+        if needs_search is not None:
+            return self._count(needs_search, reason)
+
+        if not (self.classifier_model and client):
+            return self._count(True, "nessun classificatore")
+
+        key = normalize_query(query)
+        with self._lock:
+            cached = self._decisions.get(key)
+            if cached is not None:
+                self._decisions.move_to_end(key)
+                return self._count(cached[0], cached[1] + " (cache)")
+
+        try:
+            response = client.chat(
+                model=self.classifier_model,
+                messages=[{"role": "user", "content": CLASSIFIER_PROMPT.format(query=query)}],
+                options={"num_predict": 3, "temperature": 0},
+            )
+            answer = response["message"]["content"].strip().upper()
+            decision = (not answer.startswith("NO"), f"classificatore: {answer[:10]}")
+        except Exception as e:
+            print(f"Search gate classifier error: {e}")
+            return self._count(True, "errore classificatore")
+
+        with self._lock:
+            self._decisions[key] = decision
+            while len(self._decisions) > self.cache_size:
+                self._decisions.popitem(last=False)
+        return self._count(*decision)
+
+    def _count(self, needs_search, reason):
+        with self._lock:
+            if needs_search:
+                self.searched += 1
+            else:
+                self.skipped += 1
+        return needs_search, reason
+
+    def record_search_latency(self, seconds):
+        with self._lock:
+            if self.avg_search_seconds == 0.0:
+                self.avg_search_seconds = seconds
+            else:
+                self.avg_search_seconds = 0.8 * self.avg_search_seconds + 0.2 * seconds
+
+    def describe(self, needs_search, reason, decision_seconds):
+        """Riga di log per il turno corrente."""
+        if needs_search:
+            return f"Ricerca eseguita ({reason}, decisione in {decision_seconds * 1000:.0f} ms)"
+        return (f"Ricerca saltata ({reason}, decisione in {decision_seconds * 1000:.0f} ms, "
+                f"risparmio stimato {self.avg_search_seconds:.1f} s)")
+
+
+gate = SearchGate()
+
+
+def timed_decide(query, client=None):
+    """Come `gate.decide`, restituendo anche la durata della decisione."""
+    start = time.perf_counter()
+    needs_search, reason = gate.decide(query, client)
+    return needs_search, reason, time.perf_counter() - start
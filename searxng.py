@@ -0,0 +1,167 @@
+import threading
+import time
+from html.parser import HTMLParser
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import timed
+
+# === CONFIGURAZIONE ===
+# After this many seconds in HTML mode, JSON is tried again (the instance config may change)
+REPROBE_SECONDS = 3600
+REQUEST_TIMEOUT = 5
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+# Shared keep-alive session for every SearXNG request
+session = requests.Session()
+session.headers.update({"User-Agent": USER_AGENT})
+session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+# Tags without an end tag: they must not change the nesting counters
+_VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+
+# Learned output format per SearXNG URL: url -> ("json" | "html", learned_at)
+_modes = {}
+_modes_lock = threading.Lock()
+
+
+def get_mode(searxng_url):
+    """Formato da usare per l'URL: "json" finche' non si e' visto un 403."""
+    with _modes_lock:
+        entry = _modes.get(searxng_url)
+    if entry is None:
+        return "json"
+    mode, learned_at = entry
+    if mode == "html" and time.monotonic() - learned_at > REPROBE_SECONDS:
+        return "json"
+    return mode
+
+
+def _remember_mode(searxng_url, mode):
+    with _modes_lock:
+        _modes[searxng_url] = (mode, time.monotonic())
+
+
+class _ResultExtractor(HTMLParser):
+    """
+    Estrae titolo, URL e snippet dagli `article.result` di SearXNG,
+    in un solo passaggio senza costruire l'albero.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.results = []
+        self._article_depth = 0  # nesting of <article> inside the current result
+        self._current = None
+        self._heading = False
+        self._title_link = False
+        self._content_depth = 0  # nesting inside .content / .result-content
+        self._title_parts = []
+        self._content_parts = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _VOID_TAGS:
+            if tag == "br" and self._content_depth:
+                self._content_parts.append(" ")
+            return
+        if self._current is None:
+            if tag == "article" and "result" in (dict(attrs).get("class") or "").split():
+                self._current = {"url": None}
+                self._article_depth = 1
+                self._title_parts = []
+                self._content_parts = []
+            return
+
+        if tag == "article":
+            self._article_depth += 1
+        if self._content_depth:
+            self._content_depth += 1
+            return
+        if tag in ("h3", "h4") and self._current["url"] is None:
+            self._heading = True
+        elif tag == "a" and self._heading:
+            self._title_link = True
+            self._current["url"] = dict(attrs).get("href")
+        else:
+            classes = (dict(attrs).get("class") or "").split()
+            if "content" in classes or "result-content" in classes:
+                self._content_depth = 1
+
+    def handle_endtag(self, tag):
+        # <br/> and <img/> come as start + end: their start was ignored, so is their end
+        if self._current is None or tag in _VOID_TAGS:
+            return
+        if self._content_depth:
+            self._content_depth -= 1
+        if tag == "a" and self._title_link:
+            self._title_link = False
+            self._heading = False
+        elif tag in ("h3", "h4"):
+            self._heading = False
+        elif tag == "article":
+            self._article_depth -= 1
+            if self._article_depth == 0:
+                self._finish_result()
+
+    def handle_data(self, data):
+        if self._title_link:
+            self._title_parts.append(data)
+        elif self._content_depth:
+            self._content_parts.append(data)
+
+    def _finish_result(self):
+        if self._current["url"] is not None:
+            self.results.append({
+                "title": " ".join("".join(self._title_parts).split()),
+                "url": self._current["url"],
+                "content": " ".join("".join(self._content_parts).split()),
+            })
+        self._current = None
+
+
+def parse_html_results(html):
+    extractor = _ResultExtractor()
+    extractor.feed(html)
+    extractor.close()
+    return extractor.results
+
+
+def fetch_results(searxng_url, query, language, on_error=print):
+    """
+    Esegue una ricerca su SearXNG.
+    Usa il formato gia' noto per l'URL (JSON o HTML), cosi' un'istanza con JSON
+    disabilitato non paga un secondo round-trip a ogni ricerca.
+    """
+    params = {"q": query, "language": language}
+
+    if get_mode(searxng_url) == "json":
+        try:
+            with timed("searxng_json"):
+                response = session.get(searxng_url, params={**params, "format": "json"}, timeout=REQUEST_TIMEOUT)
+                results = response.json().get("results", []) if response.status_code == 200 else None
+            if response.status_code == 200:
+                _remember_mode(searxng_url, "json")
+                return results
+            elif response.status_code == 403:
+                _remember_mode(searxng_url, "html")
+            else:
+                on_error(f"SearXNG JSON error: {response.status_code}")
+                return []
+        except Exception as e:
+            on_error(f"SearXNG connection failed: {e}")
+            return []
+
+    # HTML mode (learned, or JSON just answered 403)
+    try:
+        with timed("searxng_html"):
+            response = session.get(searxng_url, params=params, timeout=REQUEST_TIMEOUT)
+        if response.status_code == 200:
+            with timed("searxng_parse"):
+                return parse_html_results(response.text)
+        on_error(f"SearXNG HTML error: {response.status_code}")
+        return []
+    except Exception as e:
+        on_error(f"SearXNG HTML parsing failed: {e}")
+        return []
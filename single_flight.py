@@ -0,0 +1,114 @@
+import asyncio
+import contextlib
+import hashlib
+import inspect
+import json
+import threading
+
+
+def payload_key(model, messages, **options):
+    """Hash della richiesta a Ollama: stesso modello, messaggi e opzioni (host compreso) -> stessa chiave."""
+    payload = {"model": model, "messages": messages, **options}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    def __init__(self, condition):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.condition = condition
+        self.producer = None
+
+
+class SingleFlight:
+    """
+    Una sola generazione Ollama per richieste identiche in corso.
+    Chi arriva dopo riceve anche i chunk gia' prodotti; lo stream si chiude
+    quando se ne va l'ultimo.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.stats = {"streams": 0, "joined": 0}
+
+    def _join(self, key):
+        with self._lock:
+            flight = self._flights.get(key)
+            created = flight is None
+            if created:
+                flight = self._flights[key] = _Flight(asyncio.Condition())
+                self.stats["streams"] += 1
+            else:
+                self.stats["joined"] += 1
+            flight.subscribers += 1
+        return flight, created
+
+    def _leave(self, key, flight):
+        with self._lock:
+            flight.subscribers -= 1
+            last = flight.subscribers == 0
+            if last and self._flights.get(key) is flight:
+                del self._flights[key]
+        return last
+
+    def _forget(self, key, flight):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    async def stream(self, key, open_stream, slot=None, on_close=None):
+        """
+        Chunk della generazione per `key`. `open_stream()` (coroutine o async
+        iterator) and `slot` are only used when this call opens the flight.
+        `on_close(chunks)` is called if leaving closes the unfinished stream.
+        """
+        flight, created = self._join(key)
+        if created:
+            flight.producer = asyncio.create_task(self._produce(key, flight, open_stream, slot))
+        position = 0
+        try:
+            while True:
+                async with flight.condition:
+                    await flight.condition.wait_for(lambda: position < len(flight.chunks) or flight.done)
+                while position < len(flight.chunks):
+                    chunk = flight.chunks[position]
+                    position += 1
+                    yield chunk
+                if flight.done and position == len(flight.chunks):
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+        finally:
+            if self._leave(key, flight) and not flight.done:
+                # Nobody is reading anymore: close the Ollama stream
+                flight.producer.cancel()
+                if on_close is not None:
+                    on_close(len(flight.chunks))
+
+    async def _produce(self, key, flight, open_stream, slot):
+        try:
+            async with slot or contextlib.nullcontext():
+                source = open_stream()
+                if inspect.isawaitable(source):
+                    source = await source
+                try:
+                    async for chunk in source:
+                        async with flight.condition:
+                            flight.chunks.append(chunk)
+                            flight.condition.notify_all()
+                finally:
+                    if hasattr(source, "aclose"):
+                        await source.aclose()
+        except Exception as e:
+            flight.error = e
+        finally:
+            self._forget(key, flight)
+            async with flight.condition:
+                flight.done = True
+                flight.condition.notify_all()
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,47 @@
+import os
+import time
+
+# === CONFIGURAZIONE ===
+# Max UI updates per second while an answer streams
+STREAM_UPDATES_PER_SECOND = float(os.getenv("STREAM_UPDATES_PER_SECOND", "10"))
+# Flush earlier anyway when this many characters are pending
+STREAM_MAX_PENDING_CHARS = int(os.getenv("STREAM_MAX_PENDING_CHARS", "400"))
+
+
+class StreamBuffer:
+    """
+    Accumula i chunk dello stream e decide quando aggiornare la UI
+    (al massimo `updates_per_second` volte; il primo chunk subito).
+    """
+
+    def __init__(self, updates_per_second=STREAM_UPDATES_PER_SECOND,
+                 max_pending_chars=STREAM_MAX_PENDING_CHARS, clock=time.monotonic):
+        self.min_interval = 1.0 / updates_per_second if updates_per_second > 0 else 0.0
+        self.max_pending_chars = max_pending_chars
+        self._clock = clock
+        self._flushed_text = ""
+        self._pending = []
+        self._pending_chars = 0
+        self._last_flush = None
+        self.chunks = 0
+        self.flushes = 0
+
+    def add(self, content):
+        self._pending.append(content)
+        self._pending_chars += len(content)
+        self.chunks += 1
+        if self._last_flush is None:
+            return True
+        if self._pending_chars >= self.max_pending_chars:
+            return True
+        return self._clock() - self._last_flush >= self.min_interval
+
+    def flush(self):
+        """Restituisce il testo completo accumulato finora."""
+        if self._pending:
+            self._flushed_text += "".join(self._pending)
+            self._pending = []
+            self._pending_chars = 0
+        self._last_flush = self._clock()
+        self.flushes += 1
+        return self._flushed_text
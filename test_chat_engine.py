@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from benchmarks.fake_servers import FakeOllama
+from chat_engine import stream_chat
+from host_pool import host_pool
+
+MODEL = "fake-model"
+DEAD_HOST = "http://127.0.0.1:9"  # discard port: connection refused
+
+
+@pytest.fixture
+def ollama():
+    with FakeOllama(ttft=0, tokens_per_second=1000, answer_tokens=5, models=[MODEL]) as server:
+        yield server
+
+
+@pytest.fixture
+def pool():
+    added = []
+
+    def add(*urls, running=()):
+        """Host sani con il modello, come li vedrebbe il monitor."""
+        for url in urls:
+            host_pool.add_host(url)
+            state = host_pool.cached(url)
+            state.healthy = True
+            state.models = [MODEL]
+            state.running = {MODEL} if url in running else set()
+            added.append(url)
+
+    yield add
+    for url in added:
+        host_pool._hosts.pop(url, None)
+
+
+def _turn(host, session_id, use_pool=True):
+    async def run():
+        return [e async for e in stream_chat("Ciao", [], MODEL, host, use_web=False, use_pool=use_pool,
+                                             session_id=session_id, save_logs=False, remember=False)]
+    return asyncio.run(run())
+
+
+def test_fails_over_before_the_first_token(ollama, pool):
+    # The dead host ranks first (model already loaded there)
+    pool(DEAD_HOST, ollama.url, running=(DEAD_HOST,))
+    events = _turn(DEAD_HOST, "failover")
+    done = events[-1]
+    assert done["type"] == "done"
+    assert done["host"] == ollama.url
+    assert done["content"]
+    assert DEAD_HOST not in host_pool.candidates(MODEL)
+
+
+def test_error_without_another_host():
+    events = _turn(DEAD_HOST, "no-pool", use_pool=False)
+    assert events[-1]["type"] == "error"
+
+
+def test_identical_turns_on_different_hosts_are_not_coalesced(ollama):
+    with FakeOllama(ttft=0.05, tokens_per_second=200, answer_tokens=5, models=[MODEL]) as other:
+        async def run():
+            async def turn(host, session_id):
+                return [e async for e in stream_chat("Ciao", [], MODEL, host, use_web=False, session_id=session_id,
+                                                     save_logs=False, remember=False)]
+            return await asyncio.gather(turn(ollama.url, "host-a"), turn(other.url, "host-b"))
+
+        first, second = asyncio.run(run())
+    assert first[-1]["host"] == ollama.url and second[-1]["host"] == other.url
+    assert ollama.requests == 1 and other.requests == 1
@@ -0,0 +1,29 @@
+from context_packer import pack_context, split_sentences
+
+
+def test_abbreviations_and_decimals_do_not_split():
+    text = "U.S.A. e il Dott. Rossi sono qui. 3.5 milioni di persone."
+    assert split_sentences(text) == [text]
+
+
+def test_short_fragments_are_merged_not_dropped():
+    sentences = split_sentences("Sì. Ma la domanda resta molto debole in Europa. Fine.")
+    assert sentences == ["Sì. Ma la domanda resta molto debole in Europa. Fine."]
+    assert split_sentences("Breve.") == ["Breve."]
+
+
+def test_short_snippets_still_produce_context():
+    results = [{"title": "A", "content": "Sole."}, {"title": "B", "content": "Pioggia a Roma oggi."}]
+    context, sources = pack_context("meteo roma", results)
+    assert context == "A: Sole.\n\nB: Pioggia a Roma oggi."
+    assert sources == results
+
+
+def test_every_source_keeps_its_best_sentence():
+    results = [
+        {"title": "Meteo", "content": "Il meteo a Roma oggi prevede sole. " * 3 + "Domani il meteo a Roma cambia."},
+        {"title": "Altro", "content": "Un testo diverso senza parole della domanda."},
+    ]
+    context, sources = pack_context("meteo roma", results, token_budget=60)
+    assert [s["title"] for s in sources] == ["Meteo", "Altro"]
+    assert "Un testo diverso" in context
@@ -0,0 +1,40 @@
+import asyncio
+
+import pytest
+
+from generation_control import GenerationCancelled, GenerationRegistry
+
+
+def test_cancel_closes_the_stream():
+    registry = GenerationRegistry()
+    generation = registry.begin("s1", "fake-model")
+    closed = []
+
+    async def open_stream():
+        try:
+            while True:
+                await asyncio.sleep(0.01)
+                yield {"message": {"content": "x"}}
+        finally:
+            closed.append(True)
+
+    async def main():
+        received = 0
+        with pytest.raises(GenerationCancelled):
+            async for _ in generation.stream(open_stream):
+                received += 1
+                if received == 3:
+                    generation.cancel("stop")
+        return received
+
+    assert asyncio.run(main()) == 3
+    assert closed == [True]
+    registry.finish(generation)
+    assert registry.snapshot()["reasons"] == {"stop": 1}
+
+
+def test_new_message_cancels_the_previous_generation():
+    registry = GenerationRegistry()
+    first = registry.begin("s1", "fake-model")
+    registry.begin("s1", "fake-model")
+    assert first.reason == "nuovo messaggio"
@@ -0,0 +1,66 @@
+import os
+
+from log_index import LogIndex
+
+
+def _append(path, *entries):
+    with open(path, "a", encoding="utf-8") as f:
+        for role, content in entries:
+            f.write(f"### {role} (2026-10-17 10:00:00)\n{content}\n\n")
+
+
+def test_only_appended_entries_are_indexed(tmp_path):
+    log = tmp_path / "chat_log_2026-10-17.md"
+    index = LogIndex(db_path=str(tmp_path / "index.sqlite3"), log_dir=str(tmp_path))
+    _append(log, ("Utente", "meteo a roma"), ("SearXNG Gate", "meteo: ricerca web"))
+    assert index.index() == 1
+    assert index.index() == 0
+
+    _append(log, ("Assistente", "a roma c'e' il sole"))
+    assert index.index() == 1
+    assert sorted(r["role"] for r in index.search("roma")) == ["Assistente", "Utente"]
+
+
+def test_half_written_entry_waits_for_the_next_run(tmp_path):
+    log = tmp_path / "chat_log_2026-10-17.md"
+    index = LogIndex(db_path=str(tmp_path / "index.sqlite3"), log_dir=str(tmp_path))
+    log.write_text("### Utente (2026-10-17 10:00:00)\nmeteo a", encoding="utf-8")
+    assert index.index() == 0
+    with open(log, "a", encoding="utf-8") as f:
+        f.write(" roma\n\n")
+    assert index.index() == 1
+    assert index.search("roma")[0]["role"] == "Utente"
+
+
+def test_unchanged_logs_are_not_reindexed(tmp_path):
+    log = tmp_path / "chat_log_2026-10-17.md"
+    index = LogIndex(db_path=str(tmp_path / "index.sqlite3"), log_dir=str(tmp_path))
+    _append(log, ("Utente", "meteo a roma"))
+    assert index.index_if_changed(min_interval=0) == 1
+    os.utime(log, ns=(0, os.stat(log).st_mtime_ns))  # atime only: nothing changed
+    assert index.index_if_changed(min_interval=0) == 0
+    _append(log, ("Assistente", "sole"))
+    assert index.index_if_changed(min_interval=60) == 0  # too soon
+    assert index.index_if_changed(min_interval=0) == 1
+
+
+def test_rotated_logs_are_not_indexed_twice(tmp_path, monkeypatch):
+    import chat_logger
+
+    monkeypatch.setattr(chat_logger, "LOG_DIR", str(tmp_path))
+    writer = chat_logger.ChatLogWriter(jsonl=False, max_bytes=300, compress=True)
+    index = LogIndex(db_path=str(tmp_path / "index.sqlite3"), log_dir=str(tmp_path))
+    try:
+        for i in range(3):
+            writer.log("Utente", f"domanda{i} " + "x" * 40)
+            writer.flush()
+        index.index()
+        for i in range(3, 12):
+            writer.log("Utente", f"domanda{i} " + "x" * 40)
+            writer.flush()
+    finally:
+        writer.close()
+    assert any(name.endswith(".1.md.gz") for name in os.listdir(tmp_path))
+    index.index()
+    for i in range(12):
+        assert len(index.search(f"domanda{i}")) == 1
@@ -0,0 +1,55 @@
+import threading
+import time
+
+from metrics import registry
+from search_cache import SearchCache, cache
+
+
+def test_concurrent_identical_queries_share_one_fetch():
+    cache = SearchCache(db_path=None)
+    calls = []
+
+    def fetch(query):
+        calls.append(query)
+        time.sleep(0.2)
+        return [{"title": "Roma", "url": "https://example.org"}]
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda q=q: results.append(cache.get_or_fetch(q, "it", fetch)))
+        for q in ("Meteo Roma", "meteo  roma", "METEO roma", "meteo roma")
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert len(results) == 4 and all(r == results[0] for r in results)
+    assert cache.stats()["coalesced"] == 3
+    # Later lookups are plain hits
+    assert cache.get_or_fetch("meteo roma", "it", fetch) == results[0]
+    assert len(calls) == 1
+
+
+def test_empty_results_are_not_cached():
+    cache = SearchCache(db_path=None)
+    calls = []
+
+    def fetch(query):
+        calls.append(query)
+        return []
+
+    cache.get_or_fetch("niente", "it", fetch)
+    cache.get_or_fetch("niente", "it", fetch)
+    assert len(calls) == 2
+
+
+def test_stats_are_exported_on_metrics():
+    cache.get_or_fetch("metriche cache", "it", lambda q: [{"title": "x", "url": "https://example.org"}])
+    cache.get_or_fetch("metriche cache", "it", lambda q: [])
+    text = registry.render()
+    assert 'ollweb_search_cache_lookups_total{result="hits"}' in text
+    assert 'ollweb_search_cache_lookups_total{result="misses"}' in text
+    assert "ollweb_search_cache_evictions_total" in text
+    assert f"ollweb_search_cache_entries {cache.stats()['size']}" in text
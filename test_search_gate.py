@@ -0,0 +1,13 @@
+import pytest
+
+from search_gate import heuristic_decision
+
+
+@pytest.mark.parametrize("message", ["Giorgia Meloni", "Inter Milan", "Piaggio Ciao"])
+def test_short_entity_queries_are_not_skipped(message):
+    assert heuristic_decision(message)[0] is not False
+
+
+@pytest.mark.parametrize("message", ["Ciao!", "grazie mille", "ok", "Capito."])
+def test_greetings_and_acknowledgements_are_skipped(message):
+    assert heuristic_decision(message) == (False, "saluto")
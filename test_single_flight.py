@@ -0,0 +1,44 @@
+import asyncio
+
+from single_flight import SingleFlight
+
+
+def _counting_stream(opened, chunks, delay=0.01):
+    async def open_stream():
+        opened.append(1)
+        for chunk in chunks:
+            await asyncio.sleep(delay)
+            yield chunk
+    return open_stream
+
+
+def test_identical_requests_share_one_stream():
+    flights = SingleFlight()
+    opened = []
+
+    async def read():
+        return [c async for c in flights.stream("key", _counting_stream(opened, ["a", "b", "c"]))]
+
+    async def main():
+        first = asyncio.create_task(read())
+        await asyncio.sleep(0.015)  # join mid-stream: still gets every chunk
+        return await asyncio.gather(first, read())
+
+    assert asyncio.run(main()) == [["a", "b", "c"], ["a", "b", "c"]]
+    assert opened == [1]
+    assert flights.stats == {"streams": 1, "joined": 1}
+
+
+def test_last_subscriber_leaving_closes_the_stream():
+    flights = SingleFlight()
+    opened, closed = [], []
+
+    async def main():
+        agen = flights.stream("key", _counting_stream(opened, range(100)), on_close=closed.append)
+        assert await agen.__anext__() == 0
+        await agen.aclose()
+        await asyncio.sleep(0)
+
+    asyncio.run(main())
+    assert len(closed) == 1 and closed[0] < 100
+    assert not flights._flights